@@ -11,6 +11,8 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'littlelemon.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LittleLemon.settings')
+# Serve the hot read endpoints with their async implementations
+os.environ.setdefault('LITTLELEMON_ASYNC_READS', '1')
 
 application = get_asgi_application()
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+import django
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -23,7 +26,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = 'django-insecure-a+vib_nh%2_m80d+g20ti=27(7s_6w(#&%ek^zpr6m0p*v7+ni'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.environ.get('LITTLELEMON_DEBUG', '1') == '1'
 
 ALLOWED_HOSTS = []
 
@@ -44,6 +47,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'LittleLemonAPI.middleware.RequestMetricsMiddleware',
+    'LittleLemonAPI.middleware.ReplicaRoutingMiddleware',
+    'LittleLemonAPI.middleware.ThresholdGZipMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -73,16 +79,99 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'LittleLemon.wsgi.application'
 
+ASGI_APPLICATION = 'LittleLemon.asgi.application'
+
+# Route GETs on the hot read endpoints to async views. asgi.py turns this on.
+ASYNC_READS = os.environ.get('LITTLELEMON_ASYNC_READS') == '1'
+
 
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+# LITTLELEMON_DB_ENGINE=postgres selects PostgreSQL (needs psycopg), configured from
+# the LITTLELEMON_DB_* variables. Anything else uses a single SQLite file tuned for
+# concurrent writers. The test suite runs against either.
+
+DATABASE_ENGINE = os.environ.get('LITTLELEMON_DB_ENGINE', 'sqlite')
+
+# Run on every SQLite connection. WAL lets readers run alongside the writer; NORMAL
+# is durable under WAL except for the last transactions on power loss. WAL mode is
+# stored in the database file, so the committed dev db.sqlite3 is kept in WAL mode;
+# its -wal and -shm files are ignored.
+SQLITE_PRAGMAS = ['journal_mode=WAL', 'synchronous=NORMAL', 'busy_timeout=5000']
+
+if DATABASE_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('LITTLELEMON_DB_NAME', 'littlelemon'),
+            'USER': os.environ.get('LITTLELEMON_DB_USER', ''),
+            'PASSWORD': os.environ.get('LITTLELEMON_DB_PASSWORD', ''),
+            'HOST': os.environ.get('LITTLELEMON_DB_HOST', ''),
+            'PORT': os.environ.get('LITTLELEMON_DB_PORT', ''),
+            # Keep connections open between requests, and check them before reuse
+            'CONN_MAX_AGE': int(os.environ.get('LITTLELEMON_DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    # The pool option needs Django 5.1; older versions keep persistent connections
+    if os.environ.get('LITTLELEMON_DB_POOL') == '1' and django.VERSION >= (5, 1):
+        # psycopg's connection pool (needs psycopg[pool]) instead of persistent connections
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('LITTLELEMON_DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('LITTLELEMON_DB_POOL_MAX_SIZE', 10)),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('LITTLELEMON_DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': int(os.environ.get('LITTLELEMON_DB_CONN_MAX_AGE', 60)),
+            'OPTIONS': {},
+        }
+    }
+    if django.VERSION >= (5, 1):
+        DATABASES['default']['OPTIONS'] = {
+            # Take the write lock when a transaction starts, so concurrent checkouts
+            # queue on busy_timeout instead of failing with "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': '; '.join(f'PRAGMA {pragma}' for pragma in SQLITE_PRAGMAS),
+        }
+    # Before 5.1 SQLite OPTIONS go straight to sqlite3.connect(), so the pragmas are
+    # run by a connection_created receiver (see LittleLemonAPI/signals.py) and
+    # transactions start deferred
+
+# Read replicas, comma-separated in LITTLELEMON_DB_REPLICAS: hosts for PostgreSQL,
+# files for SQLite. They become replica1, replica2, ... and serve safe-method reads
+# of LittleLemonAPI models through LittleLemonAPI.routers.ReplicaRouter.
+DATABASE_REPLICAS = []
+for index, replica in enumerate(filter(None, os.environ.get('LITTLELEMON_DB_REPLICAS', '').split(',')), 1):
+    alias = f'replica{index}'
+    DATABASES[alias] = {**DATABASES['default'], 'OPTIONS': dict(DATABASES['default']['OPTIONS']), 'TEST': {'MIRROR': 'default'}}
+    DATABASES[alias]['HOST' if DATABASE_ENGINE == 'postgres' else 'NAME'] = replica.strip()
+    DATABASE_REPLICAS.append(alias)
+
+# The throttle counters (see LittleLemonAPI/throttling.py) are written on every
+# throttled request, reads included. On SQLite they get a file of their own, so
+# those writes never queue behind the main database's write lock; PostgreSQL keeps
+# them in the primary, where an upsert only locks its own row. Create its table with
+# `manage.py migrate --database throttle`.
+THROTTLE_DATABASE = None
+if DATABASE_ENGINE != 'postgres':
+    THROTTLE_DATABASE = 'throttle'
+    DATABASES['throttle'] = {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('LITTLELEMON_THROTTLE_DB_NAME', Path(DATABASES['default']['NAME']).with_name('throttle.sqlite3')),
+        'CONN_MAX_AGE': DATABASES['default']['CONN_MAX_AGE'],
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
     }
-}
+
+DATABASE_ROUTERS = ['LittleLemonAPI.routers.ThrottleRouter', 'LittleLemonAPI.routers.ReplicaRouter']
+
+# Seconds a user's reads stay on the primary after they write, so they read their own writes
+REPLICA_PIN_SECONDS = 5
 
 
 # Password validation
@@ -127,16 +216,16 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
+    # The browsable API is for development only
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
-    ],
+        'LittleLemonAPI.renderers.FastJSONRenderer',
+    ] + (['rest_framework.renderers.BrowsableAPIRenderer'] if DEBUG else []),
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle',
+        'LittleLemonAPI.throttling.SharedAnonRateThrottle',
+        'LittleLemonAPI.throttling.SharedUserRateThrottle',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES':[
-        'rest_framework.authentication.TokenAuthentication',
+        'LittleLemonAPI.authentication.CachedTokenAuthentication',
         "rest_framework.authentication.SessionAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
@@ -151,4 +240,55 @@ REST_FRAMEWORK = {
 
 DJOSER = {
     'USER_ID_FIELD' : 'username'
-}
\ No newline at end of file
+}
+
+# Serve the /menu-items and /orders listings from .values() rows through the compact
+# serializers; the JSON is identical either way
+COMPACT_SERIALIZERS = True
+
+# The menu cache and its version, the replica pins, the group ids and the token lookups
+# live in the default cache, which every worker process must share. LITTLELEMON_REDIS_URL
+# selects Redis (needs the redis package); without it each process has its own
+# LocMemCache, which only suits a single process such as runserver or the tests.
+# `manage.py check --deploy` fails while the default cache is process-local.
+if os.environ.get('LITTLELEMON_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['LITTLELEMON_REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Seconds a /menu-items response stays cached; writes invalidate it immediately
+MENU_CACHE_TIMEOUT = 60 * 5
+
+# Cache alias for throttle counters. Must support atomic incr() (Redis, Memcached);
+# when unset the counters are kept in THROTTLE_DATABASE, or the primary without one.
+THROTTLE_CACHE = 'default' if os.environ.get('LITTLELEMON_REDIS_URL') else None
+
+# Responses smaller than this many bytes are sent uncompressed by ThresholdGZipMiddleware
+GZIP_MIN_LENGTH = 1024
+
+# Cache alias and lifetime of CachedTokenAuthentication's token lookups. Tokens are
+# only cached in a shared backend (Redis, Memcached), so every worker sees the
+# invalidations; a process-local alias (LocMemCache) looks them up on every request.
+# The backend's size limit (MAX_ENTRIES, maxmemory) bounds the cache.
+TOKEN_CACHE = 'default'
+TOKEN_CACHE_TIMEOUT = 60 * 5
+
+# Assign each new order to the least loaded delivery crew member at checkout. Orders
+# placed while no crew is available are picked up by `manage.py dispatch_orders`.
+DISPATCH_ON_CHECKOUT = False
+
+# Delivered orders older than this many days are moved to the archive tables by
+# `manage.py archive_orders`; /orders/<id> and the export still find them
+ORDER_ARCHIVE_AFTER_DAYS = 365
+
+# Requests slower than this are logged with their SQL by RequestMetricsMiddleware; None disables the log
+SLOW_REQUEST_THRESHOLD_MS = 500
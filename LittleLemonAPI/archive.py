@@ -0,0 +1,55 @@
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem
+
+
+# Hot/cold split of the orders. Delivered orders older than ORDER_ARCHIVE_AFTER_DAYS
+# are moved, with their items, from Order/OrderItem to ArchivedOrder/ArchivedOrderItem
+# BATCH_SIZE orders per transaction, oldest first. A batch is copied and deleted
+# atomically, so an interrupted run loses nothing and the next one carries on where
+# it stopped. The sales rollups are left alone: archived orders are still sales.
+
+BATCH_SIZE = 1000
+ORDER_COLUMNS = ['id', 'user_id', 'delivery_crew_id', 'status', 'total', 'date', 'version']
+ITEM_COLUMNS = ['id', 'order_id', 'menuitem_id', 'quantity', 'unit_price', 'price']
+
+
+def cutoff(days=None):
+    if days is None:
+        days = getattr(settings, 'ORDER_ARCHIVE_AFTER_DAYS', 365)
+    return date.today() - timedelta(days=days)
+
+
+def archivable(before):
+    return Order.objects.filter(status=True, date__lt=before)
+
+
+def archive_batch(before, batch_size):
+    with transaction.atomic():
+        # Read in (status, date, id) index order, so no batch sorts the whole backlog.
+        # Orders locked by an update in progress are left for the next run.
+        orders = list(archivable(before).select_for_update(skip_locked=True).order_by('date', 'id').values(*ORDER_COLUMNS)[:batch_size])
+        if not orders:
+            return 0
+        ids = [order['id'] for order in orders]
+        items = OrderItem.objects.filter(order_id__in=ids).values(*ITEM_COLUMNS)
+        ArchivedOrder.objects.bulk_create([ArchivedOrder(**order) for order in orders])
+        ArchivedOrderItem.objects.bulk_create([ArchivedOrderItem(**item) for item in items])
+        # Cascades to the items
+        Order.objects.filter(pk__in=ids).delete()
+    return len(orders)
+
+
+def archive_orders(days=None, batch_size=BATCH_SIZE, limit=None):
+    # Returns the number of orders archived; limit bounds a run to about that many
+    before = cutoff(days)
+    archived = 0
+    while limit is None or archived < limit:
+        count = archive_batch(before, batch_size if limit is None else min(batch_size, limit - archived))
+        archived += count
+        if not count:
+            break
+    return archived
@@ -0,0 +1,102 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.response import Response
+
+from .cache import AsyncMenuCacheMixin
+from .roles import aget_roles
+from .views import MenuItemsView, MenuItemView, OrdersView, OrderView
+
+
+# Async GET implementations of the hot read endpoints, used when serving over
+# ASGI with ASYNC_READS on. They reuse the sync views' querysets, filters,
+# paginators and serializers, and only swap the database round trips for the
+# async ORM. Writes keep going to the sync views (see read_write_view).
+
+class AsyncDispatchMixin():
+    http_method_names = ['get', 'head', 'options']
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            # Authentication, permissions and throttles touch the database: run them in one thread hop
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncListMixin():
+    async def get(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer([row async for row in queryset] if page is None else page, many=True)
+        if hasattr(serializer, 'aload'):
+            # Compact serializers fetch nested rows themselves
+            await serializer.aload()
+        if page is None:
+            return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
+
+
+class AsyncRetrieveMixin():
+    async def get(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset())
+        instance = await queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]}).afirst()
+        if instance is None:
+            raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+        self.check_object_permissions(request, instance)
+        return Response(self.get_serializer(instance).data)
+
+
+class AsyncMenuItemsView(AsyncMenuCacheMixin, AsyncListMixin, AsyncDispatchMixin, MenuItemsView):
+    pass
+
+
+class AsyncMenuItemView(AsyncMenuCacheMixin, AsyncRetrieveMixin, AsyncDispatchMixin, MenuItemView):
+    pass
+
+
+class AsyncOrdersView(AsyncListMixin, AsyncDispatchMixin, OrdersView):
+    async def get(self, request, *args, **kwargs):
+        # get_queryset() filters on the roles, so resolve them before it runs
+        await aget_roles(request)
+        return await super().get(request, *args, **kwargs)
+
+
+class AsyncOrderView(AsyncDispatchMixin, OrderView):
+    async def get(self, request, *args, **kwargs):
+        orders = [order async for order in self.get_queryset()] or [order async for order in self.get_archived_queryset()]
+        return self.detail_response(request, orders, await aget_roles(request))
+
+
+def read_write_view(view, async_view):
+    # One URL, two implementations: GET/HEAD go to the async view, every other
+    # method to the sync view in a worker thread.
+    read = async_view.as_view()
+    write = sync_to_async(view.as_view())
+
+    async def dispatch(request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            return await read(request, *args, **kwargs)
+        return await write(request, *args, **kwargs)
+
+    dispatch.view_class = view
+    return csrf_exempt(dispatch)
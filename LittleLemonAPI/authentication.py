@@ -0,0 +1,60 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .cache import is_process_local
+
+
+# TokenAuthentication that keeps each token, with its user, in the TOKEN_CACHE
+# alias for TOKEN_CACHE_TIMEOUT seconds instead of loading both on every request.
+# Entries are dropped when the token is deleted (djoser's logout) or the user is
+# saved (deactivation, password or permission changes), see signals.py. Writes
+# that bypass signals, like User.objects.update(is_active=False), must call
+# forget_user_tokens().
+#
+# A process-local alias (LocMemCache) turns the caching off: each worker would keep
+# accepting a token for TOKEN_CACHE_TIMEOUT after it was revoked through another.
+
+def token_cache():
+    cache = caches[getattr(settings, 'TOKEN_CACHE', 'default')]
+    return None if is_process_local(cache) else cache
+
+
+def token_cache_key(key):
+    # Hashed so the cache never holds usable credentials in its keys
+    return 'auth-token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def forget_token(key):
+    cache = token_cache()
+    if cache is not None:
+        cache.delete(token_cache_key(key))
+
+
+def forget_user_tokens(user):
+    cache = token_cache()
+    if cache is not None:
+        keys = Token.objects.filter(user=user).values_list('key', flat=True)
+        cache.delete_many([token_cache_key(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        cache = token_cache()
+        if cache is None:
+            return super().authenticate_credentials(key)
+
+        cache_key = token_cache_key(key)
+        token = cache.get(cache_key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(cache_key, token, getattr(settings, 'TOKEN_CACHE_TIMEOUT', 300))
+            return user, token
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        return token.user, token
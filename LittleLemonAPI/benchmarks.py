@@ -0,0 +1,445 @@
+import asyncio
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User, Group
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import include, path
+from django.utils.text import compress_string
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework.views import APIView
+
+from . import reporting
+from .models import Cart, Category, MenuItem, Order, OrderItem
+from .renderers import FastJSONRenderer
+from .serializers import MenuItemSerializer, UserOrdersSerializer, CompactMenuItemSerializer, CompactOrderSerializer
+from .urls import api_patterns
+
+
+# Benchmarks run by `python manage.py benchmark <name>` against a throwaway test
+# database. Each one is a function taking a Results collector and the command's
+# options, and records one entry per case it measures.
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def measure(func, repeat, setup=None):
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def count_queries(func, setup=None):
+    if setup:
+        setup()
+    with CaptureQueriesContext(connection) as queries:
+        func()
+    return len(queries)
+
+
+def percentile(timings, pct):
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Results:
+    def __init__(self, stdout):
+        self.stdout = stdout
+        self.cases = {}
+
+    def record(self, label, timings, queries=None, elapsed=None, rows=None, size=None):
+        # elapsed: wall time of a concurrent run, for throughput; defaults to the timings run back to back.
+        # rows: rows handled per timing, reported as rows per second at p50. size: bytes produced.
+        stats = {
+            'p50': percentile(timings, 50) * 1000,
+            'p95': percentile(timings, 95) * 1000,
+            'p99': percentile(timings, 99) * 1000,
+            'rps': len(timings) / (elapsed or sum(timings)),
+            'queries': queries,
+        }
+        if rows:
+            stats['rows_per_second'] = rows / percentile(timings, 50)
+        if size is not None:
+            stats['bytes'] = size
+        self.cases[label] = stats
+        self.stdout.write('{:<44} p50 {:8.2f}ms  p95 {:8.2f}ms  p99 {:8.2f}ms  {:8.1f} req/s  {:>4} queries{}{}'.format(
+            label, stats['p50'], stats['p95'], stats['p99'], stats['rps'], '-' if queries is None else queries,
+            f'  {stats["rows_per_second"]:10.0f} rows/s' if rows else '',
+            f'  {size:9d} bytes' if size is not None else '',
+        ))
+
+
+def unthrottled():
+    # Throttling would reject the repeated requests, so benchmarks measure the views without it.
+    return mock.patch.object(APIView, 'check_throttles', lambda self, request: None)
+
+
+def seed_menu(count, prefix='Bench dish'):
+    category, _ = Category.objects.get_or_create(slug='bench', defaults={'title': 'Bench'})
+    return MenuItem.objects.bulk_create([
+        MenuItem(title=f'{prefix} {i}', price=Decimal('5.00') + i % 50, featured=i % 3 == 0, category=category)
+        for i in range(count)
+    ])
+
+
+def seed(options):
+    # Users, groups, menu, a cart and orders with items at the requested scale
+    managers, _ = Group.objects.get_or_create(name='manager')
+    crew, _ = Group.objects.get_or_create(name='delivery-crew')
+    users = User.objects.bulk_create([User(username=f'bench-user-{i}') for i in range(options['users'])])
+    drivers = User.objects.bulk_create([User(username=f'bench-driver-{i}') for i in range(max(1, options['users'] // 20))])
+    manager = User.objects.create(username='bench-manager')
+    managers.user_set.add(manager)
+    crew.user_set.add(*drivers)
+
+    menu = seed_menu(options['menu_items'])
+    orders = Order.objects.bulk_create([
+        Order(user=users[i % len(users)], delivery_crew=drivers[i // 2 % len(drivers)] if i % 2 else None, status=i % 4 == 0, total=Decimal('0.00'))
+        for i in range(options['orders'])
+    ])
+    lines = options['items_per_order']
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, menuitem=menu[(index + offset) % len(menu)], quantity=1, unit_price=menu[(index + offset) % len(menu)].price, price=menu[(index + offset) % len(menu)].price)
+        for index, order in enumerate(orders) for offset in range(lines)
+    ], batch_size=1000)
+    Cart.objects.bulk_create([
+        Cart(user=users[0], menuitem=item, quantity=1, unit_price=item.price, price=item.price)
+        for item in menu[:10]
+    ])
+    reporting.rebuild()
+    return users, drivers, manager, menu, orders
+
+
+Case = namedtuple('Case', 'label method url user data setup format', defaults=(None, None, 'json'))
+
+
+def fill_cart(user, menu):
+    def setup():
+        Cart.objects.filter(user=user).delete()
+        Cart.objects.bulk_create([Cart(user=user, menuitem=item, quantity=1, unit_price=item.price, price=item.price) for item in menu])
+    return setup
+
+
+@benchmark('endpoints')
+def endpoints(results, options):
+    users, drivers, manager, menu, orders = seed(options)
+    customer, shopper, spare = users[0], users[1], users[2]
+    driver = drivers[0]
+    customer_order = next(order for order in orders if order.user_id == customer.id)
+    crew_order = next(order for order in orders if order.delivery_crew_id == driver.id)
+    state = {}
+
+    def disposable_order():
+        order = Order.objects.create(user=customer, status=False, total=Decimal('5.00'))
+        OrderItem.objects.create(order=order, menuitem=menu[0], quantity=1, unit_price=menu[0].price, price=menu[0].price)
+        state['order'] = order.id
+
+    def disposable_item():
+        state['item'] = MenuItem.objects.create(title='Bench disposable', price=Decimal('5.00'), featured=False, category_id=menu[0].category_id).id
+
+    def add_spare(group):
+        return lambda: Group.objects.get(name=group).user_set.add(spare)
+
+    assignments = [{'order_id': order.id, 'delivery_crew': drivers[i % len(drivers)].id} for i, order in enumerate(orders[:100])]
+    deliveries = [{'order_id': order.id, 'status': True} for order in orders if order.delivery_crew_id == driver.id][:100]
+    catalogue_csv = ''.join(['title,price,category\n'] + [f'{i.title},{i.price + 1},bench\n' for i in menu[:100]]).encode()
+    item = {'title': 'Bench special', 'price': '9.99', 'featured': False, 'category': menu[0].category_id}
+    cases = [
+        Case('GET users/users/me', 'get', '/api/users/users/me/', customer),
+        Case('GET menu-items', 'get', '/api/menu-items', customer),
+        Case('GET menu-items search+ordering', 'get', '/api/menu-items?search=bench&ordering=-price', customer),
+        Case('GET menu-items category+featured', 'get', f'/api/menu-items?category={menu[0].category_id}&featured=true', customer),
+        Case('GET menu-items/<id>', 'get', f'/api/menu-items/{menu[0].id}', customer),
+        Case('POST menu-items', 'post', '/api/menu-items', manager, item),
+        Case('PUT menu-items/<id>', 'put', f'/api/menu-items/{menu[1].id}', manager, item),
+        Case('PATCH menu-items/<id>', 'patch', f'/api/menu-items/{menu[1].id}', manager, {'price': '8.99'}),
+        Case('DELETE menu-items/<id>', 'delete', lambda: f'/api/menu-items/{state["item"]}', manager, None, disposable_item),
+        Case('POST menu-items/import (100 rows)', 'post', '/api/menu-items/import', manager, lambda: {'file': SimpleUploadedFile('menu.csv', catalogue_csv)}, None, 'multipart'),
+        Case('GET groups/manager/users', 'get', '/api/groups/manager/users', manager),
+        Case('POST groups/manager/users', 'post', '/api/groups/manager/users', manager, {'username': spare.username}),
+        Case('DELETE groups/manager/users/<id>', 'delete', f'/api/groups/manager/users/{spare.id}', manager, None, add_spare('manager')),
+        Case('GET groups/delivery-crew/users', 'get', '/api/groups/delivery-crew/users', manager),
+        Case('POST groups/delivery-crew/users', 'post', '/api/groups/delivery-crew/users', manager, {'username': spare.username}),
+        Case('DELETE groups/delivery-crew/users/<id>', 'delete', f'/api/groups/delivery-crew/users/{spare.id}', manager, None, add_spare('delivery-crew')),
+        Case('GET cart/menu-items', 'get', '/api/cart/menu-items', customer),
+        Case('POST cart/menu-items', 'post', '/api/cart/menu-items', shopper, {'menuitem': menu[0].id, 'quantity': 2}, fill_cart(shopper, [])),
+        Case('POST cart/menu-items batch of 20', 'post', '/api/cart/menu-items', shopper, [{'menuitem': i.id, 'quantity': 2} for i in menu[:20]]),
+        Case('DELETE cart/menu-items', 'delete', '/api/cart/menu-items', shopper, None, fill_cart(shopper, menu[:10])),
+        Case('GET orders as manager', 'get', '/api/orders', manager),
+        Case('GET orders as delivery crew', 'get', '/api/orders', driver),
+        Case('GET orders as customer', 'get', '/api/orders', customer),
+        Case('POST orders (10 lines)', 'post', '/api/orders', shopper, None, fill_cart(shopper, menu[:10])),
+        Case('GET orders/<id>', 'get', f'/api/orders/{customer_order.id}', customer),
+        Case('PATCH orders/<id> as manager', 'patch', f'/api/orders/{crew_order.id}', manager, {'user': crew_order.user_id, 'delivery_crew': driver.id}),
+        Case('PATCH orders/<id> as delivery crew', 'patch', f'/api/orders/{crew_order.id}', driver, {'status': True}),
+        Case('DELETE orders/<id>', 'delete', lambda: f'/api/orders/{state["order"]}', manager, None, disposable_order),
+        Case('POST orders/bulk status (crew)', 'post', '/api/orders/bulk', driver, deliveries),
+        Case('POST orders/bulk assign 100 (manager)', 'post', '/api/orders/bulk', manager, assignments),
+        Case('GET orders/export', 'get', '/api/orders/export?status=false', manager),
+        Case('GET reports/daily', 'get', '/api/reports/daily', manager),
+        Case('GET reports/menu-items', 'get', '/api/reports/menu-items', manager),
+        Case('GET reports/categories', 'get', '/api/reports/categories', manager),
+        Case('GET reports/delivery-crew', 'get', '/api/reports/delivery-crew', manager),
+        Case('GET metrics', 'get', '/api/metrics', manager),
+    ]
+
+    client = APIClient()
+    with unthrottled():
+        for case in cases:
+            def request(case=case):
+                client.force_authenticate(case.user)
+                url = case.url() if callable(case.url) else case.url
+                data = case.data() if callable(case.data) else case.data
+                response = getattr(client, case.method)(url, data, format=case.format)
+                if getattr(response, 'streaming', False):
+                    for _ in response.streaming_content:
+                        pass
+                assert response.status_code < 400, f'{case.label}: {response.status_code} {response.content[:200]}'
+
+            queries = count_queries(request, case.setup)
+            results.record(case.label, measure(request, options['repeat'], case.setup), queries)
+
+
+@benchmark('checkout')
+def checkout(results, options):
+    customer, _ = User.objects.get_or_create(username='bench-customer')
+    menu = seed_menu(100, prefix='Checkout dish')
+    client = APIClient()
+    client.force_authenticate(customer)
+
+    for lines in (1, 10, 100):
+        def place_order():
+            response = client.post('/api/orders')
+            assert response.status_code == 201, response.content
+
+        with unthrottled():
+            queries = count_queries(place_order, fill_cart(customer, menu[:lines]))
+            timings = measure(place_order, options['repeat'], setup=fill_cart(customer, menu[:lines]))
+        results.record(f'checkout {lines} line(s)', timings, queries)
+
+
+@benchmark('serializers')
+def serializers(results, options):
+    # Fetching and serializing listings of 1k/10k/100k rows, model serializers against compact ones
+    from .views import OrderGraphMixin
+
+    sizes = (1000, 10000, 100000)
+    customer, _ = User.objects.get_or_create(username='bench-serializer-customer')
+    menu = seed_menu(max(sizes), prefix='Serializer dish')
+    orders = Order.objects.bulk_create([
+        Order(user=customer, status=i % 2 == 0, total=Decimal('12.50')) for i in range(max(sizes))
+    ], batch_size=5000)
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, menuitem=menu[(index + offset) % 100], quantity=1, unit_price=menu[(index + offset) % 100].price, price=menu[(index + offset) % 100].price)
+        for index, order in enumerate(orders) for offset in range(options['items_per_order'])
+    ], batch_size=5000)
+
+    menu_items = MenuItem.objects.filter(title__startswith='Serializer dish').order_by('id')
+    customer_orders = Order.objects.filter(user=customer).order_by('id')
+    paths = {
+        'menu-items model': lambda rows: MenuItemSerializer(list(menu_items[:rows]), many=True).data,
+        'menu-items compact': lambda rows: CompactMenuItemSerializer(list(CompactMenuItemSerializer.values(menu_items[:rows]))).data,
+        'orders model': lambda rows: UserOrdersSerializer(list(OrderGraphMixin().get_order_queryset().filter(user=customer).order_by('id')[:rows]), many=True, context={'request': None}).data,
+        'orders compact': lambda rows: CompactOrderSerializer(list(CompactOrderSerializer.values(customer_orders[:rows]))).data,
+    }
+    for rows in sizes:
+        repeat = max(3, options['repeat'] * 1000 // rows)
+        for label, serialize in paths.items():
+            results.record(f'{label} {rows} rows', measure(lambda: serialize(rows), repeat), count_queries(lambda: serialize(rows)), rows=rows)
+
+
+@benchmark('renderers')
+def renderers(results, options):
+    # Rendering the /orders payload and the bytes it puts on the wire, stdlib JSON against orjson, with and without gzip
+    users, drivers, manager, menu, orders = seed(options)
+    client = APIClient()
+    client.force_authenticate(manager)
+
+    for page_size in (50, 100):
+        with unthrottled():
+            data = client.get(f'/api/orders?page_size={page_size}').data
+        for label, renderer in (('DRF JSONRenderer', JSONRenderer()), ('FastJSONRenderer', FastJSONRenderer())):
+            body = renderer.render(data)
+            results.record(f'render orders x{page_size} {label}', measure(lambda: renderer.render(data), options['repeat'] * 5), size=len(body))
+            results.record(f'render+gzip orders x{page_size} {label}', measure(lambda: compress_string(renderer.render(data)), options['repeat'] * 5), size=len(compress_string(body)))
+
+        for label, headers in (('identity', {}), ('gzip', {'HTTP_ACCEPT_ENCODING': 'gzip'})):
+            def request():
+                response = client.get(f'/api/orders?page_size={page_size}', **headers)
+                assert response.status_code == 200
+                return response
+
+            with unthrottled():
+                size = len(request().content)
+                results.record(f'GET orders x{page_size} {label}', measure(request, options['repeat']), count_queries(request), size=size)
+
+
+class AsyncReadsURLConf:
+    urlpatterns = [path('api/', include(api_patterns(async_reads=True)))]
+
+
+def run_wsgi(url, headers, requests, concurrency):
+    # Client requests from a pool of threads, as a threaded WSGI server would run them
+    def request(_):
+        start = time.perf_counter()
+        response = Client().get(url, headers=headers)
+        assert response.status_code == 200, f'{url}: {response.status_code} {response.content[:200]}'
+        return time.perf_counter() - start
+
+    def worker(count):
+        try:
+            return [request(i) for i in range(count)]
+        finally:
+            connections.close_all()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        timings = [t for batch in pool.map(worker, split(requests, concurrency)) for t in batch]
+    return timings, time.perf_counter() - start
+
+
+async def run_asgi(url, headers, requests, concurrency):
+    # Concurrent AsyncClient requests on one event loop, as an ASGI server would run them
+    async def worker(count):
+        timings = []
+        client = AsyncClient()
+        for _ in range(count):
+            start = time.perf_counter()
+            response = await client.get(url, headers=headers)
+            assert response.status_code == 200, f'{url}: {response.status_code} {response.content[:200]}'
+            timings.append(time.perf_counter() - start)
+        return timings
+
+    start = time.perf_counter()
+    batches = await asyncio.gather(*(worker(count) for count in split(requests, concurrency)))
+    return [t for batch in batches for t in batch], time.perf_counter() - start
+
+
+def split(requests, concurrency):
+    return [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+
+
+@benchmark('asgi')
+def asgi(results, options):
+    users, drivers, manager, menu, orders = seed(options)
+    concurrency = options['concurrency']
+    requests = max(options['repeat'], 1) * concurrency
+    customer = users[0]
+    customer_order = next(order for order in orders if order.user_id == customer.id)
+    token = Token.objects.create(user=customer)
+    headers = {'Authorization': f'Token {token.key}'}
+
+    urls = [
+        ('menu-items', '/api/menu-items'),
+        ('menu-items/<id>', f'/api/menu-items/{menu[0].id}'),
+        ('orders', '/api/orders'),
+        ('orders/<id>', f'/api/orders/{customer_order.id}'),
+    ]
+    with unthrottled():
+        for label, url in urls:
+            cache.clear()
+            timings, elapsed = run_wsgi(url, headers, requests, concurrency)
+            results.record(f'WSGI GET {label} x{concurrency}', timings, elapsed=elapsed)
+            cache.clear()
+            with override_settings(ROOT_URLCONF=AsyncReadsURLConf):
+                timings, elapsed = async_to_sync(run_asgi)(url, headers, requests, concurrency)
+            results.record(f'ASGI GET {label} x{concurrency}', timings, elapsed=elapsed)
+
+
+@benchmark('dispatch')
+def dispatch_orders(results, options):
+    # Assigning 10k pending orders across 100 delivery crew members, at several batch sizes
+    from . import dispatch
+
+    crew, _ = Group.objects.get_or_create(name='delivery-crew')
+    customer, _ = User.objects.get_or_create(username='bench-dispatch-customer')
+    drivers = User.objects.bulk_create([User(username=f'bench-dispatch-driver-{i}') for i in range(100)])
+    crew.user_set.add(*drivers)
+    # Uneven open loads to balance against
+    Order.objects.bulk_create([
+        Order(user=customer, delivery_crew=driver, status=False, total=Decimal('12.50'))
+        for index, driver in enumerate(drivers) for _ in range(index % 10)
+    ])
+    pending = Order.objects.bulk_create([Order(user=customer, status=False, total=Decimal('12.50')) for _ in range(10000)], batch_size=5000)
+    pending_ids = [order.id for order in pending]
+
+    def reset():
+        Order.objects.filter(pk__in=pending_ids).update(delivery_crew=None)
+        reporting.rebuild()
+
+    for batch_size in (100, 500, 2000):
+        def run():
+            assert dispatch.dispatch(batch_size) == len(pending_ids)
+
+        repeat = max(3, options['repeat'] // 4)
+        results.record(f'dispatch 10000 orders to 100 crew, batches of {batch_size}', measure(run, repeat, setup=reset), count_queries(run, setup=reset), rows=len(pending_ids))
+
+
+@benchmark('catalogue')
+def catalogue_import(results, options):
+    # Importing a 100k row catalogue CSV: all new, then half the prices changed, then unchanged.
+    # Then peak Python memory, reported as the case's size, for new files of 10k and 100k rows.
+    import tempfile
+    import tracemalloc
+
+    from .catalogue import import_menu
+
+    def write(path, rows, prefix, price_change=0):
+        with open(path, 'w', newline='') as csv_file:
+            csv_file.write('title,price,featured,category,category_title\n')
+            for i in range(rows):
+                price = Decimal('5.00') + i % 50 + (price_change if i % 2 else 0)
+                csv_file.write(f'{prefix} {i},{price},{"true" if i % 3 == 0 else "false"},season-{i % 20},Season {i % 20}\n')
+
+    def run(path):
+        with open(path, newline='') as csv_file, CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            result = import_menu(csv_file)
+            return result, time.perf_counter() - start, len(queries)
+
+    def traced(path):
+        # Without query logging (DEBUG, CaptureQueriesContext), which keeps the statements
+        with open(path, newline='') as csv_file, override_settings(DEBUG=False):
+            tracemalloc.start()
+            start = time.perf_counter()
+            result = import_menu(csv_file)
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return result, elapsed, peak
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = f'{directory}/catalogue.csv'
+        for label, price_change, expected in (('new', 0, 'created'), ('half changed', 1, 'updated'), ('unchanged', 1, 'unchanged')):
+            write(path, 100000, 'Catalogue dish', price_change)
+            result, elapsed, queries = run(path)
+            assert getattr(result, expected) >= 50000, result.as_dict()
+            results.record(f'import 100000 rows, {label}', [elapsed], queries, rows=100000)
+
+        for rows in (10000, 100000):
+            write(path, rows, f'Traced dish {rows}')
+            result, elapsed, peak = traced(path)
+            assert result.created == rows, result.as_dict()
+            results.record(f'import {rows} new rows, memory traced', [elapsed], rows=rows, size=peak)
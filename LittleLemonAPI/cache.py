@@ -0,0 +1,100 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from .routers import primary_reads
+
+
+# Read-through cache for the public menu catalogue. Entries are keyed on the
+# catalogue version, so bumping the version on any MenuItem/Category write
+# invalidates every cached listing and detail at once.
+
+MENU_VERSION_KEY = 'menu-catalogue-version'
+
+
+def get_menu_version():
+    version = cache.get(MENU_VERSION_KEY)
+    if version is None:
+        cache.add(MENU_VERSION_KEY, 1, timeout=None)
+        version = cache.get(MENU_VERSION_KEY, 1)
+    return version
+
+
+async def aget_menu_version():
+    version = await cache.aget(MENU_VERSION_KEY)
+    if version is None:
+        await cache.aadd(MENU_VERSION_KEY, 1, timeout=None)
+        version = await cache.aget(MENU_VERSION_KEY, 1)
+    return version
+
+
+def bump_menu_version(*args, **kwargs):
+    # Also used as a signal receiver. Writes that bypass signals (queryset.update,
+    # bulk_create) must call this explicitly.
+    try:
+        cache.incr(MENU_VERSION_KEY)
+    except ValueError:
+        cache.add(MENU_VERSION_KEY, 1, timeout=None)
+        cache.incr(MENU_VERSION_KEY)
+
+
+def menu_cache_keys(request, version):
+    digest = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f'"{version}-{digest}"', f'menu:{version}:{digest}'
+
+
+def not_modified(request, etag):
+    # Weak comparison: GZipMiddleware weakens the ETags it sends
+    if etag in [tag.removeprefix('W/') for tag in parse_etags(request.headers.get('If-None-Match', ''))]:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+
+class MenuCacheMixin():
+    def get(self, request, *args, **kwargs):
+        etag, key = menu_cache_keys(request, get_menu_version())
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        data = cache.get(key)
+        if data is None:
+            # Filled from the primary: a lagging replica's result would be cached under
+            # the new version and served to everyone, including the user who wrote
+            with primary_reads():
+                response = super().get(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            cache.set(key, data, getattr(settings, 'MENU_CACHE_TIMEOUT', 300))
+        return Response(data, headers={'ETag': etag})
+
+
+class AsyncMenuCacheMixin():
+    # MenuCacheMixin for async views, around an async get()
+    async def get(self, request, *args, **kwargs):
+        etag, key = menu_cache_keys(request, await aget_menu_version())
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        data = await cache.aget(key)
+        if data is None:
+            with primary_reads():
+                response = await super().get(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            await cache.aset(key, data, getattr(settings, 'MENU_CACHE_TIMEOUT', 300))
+        return Response(data, headers={'ETag': etag})
+
+
+def is_process_local(backend):
+    # Each worker process has its own LocMemCache, and DummyCache keeps nothing, so
+    # neither carries a write or an invalidation from one worker to the others
+    return isinstance(backend, (LocMemCache, DummyCache))
@@ -0,0 +1,156 @@
+import csv
+from decimal import Decimal, InvalidOperation
+
+from django.core.validators import slug_re
+from django.db import transaction
+
+from .bulk import case_update
+from .cache import bump_menu_version
+from .models import Category, MenuItem
+
+
+# Streaming import of the menu catalogue from CSV with the columns title, price and
+# category (a Category slug), and optionally featured and category_title. Rows are
+# read and written BATCH_SIZE at a time, so memory use doesn't depend on the size of
+# the file. Menu items are matched on title and category: new ones are created,
+# changed ones updated. Without a featured column new items aren't featured and
+# existing ones keep their flag. Unknown categories are created, titled category_title or
+# their slug. Invalid rows are skipped and reported. Each batch is its own transaction,
+# so a large file never holds the write lock for long; a file that fails part way
+# keeps the batches before the failure, and importing it again is safe.
+
+BATCH_SIZE = 1000
+MAX_ERRORS = 100
+REQUIRED_COLUMNS = ['title', 'price', 'category']
+TRUE_VALUES = {'1', 'true', 'yes', 'y'}
+FALSE_VALUES = {'', '0', 'false', 'no', 'n'}
+CENT = Decimal('0.01')
+MAX_PRICE = Decimal('9999.99')
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.invalid = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.invalid += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({'line': line, 'message': message})
+
+    def as_dict(self):
+        return {'created': self.created, 'updated': self.updated, 'unchanged': self.unchanged, 'invalid': self.invalid, 'errors': self.errors}
+
+
+def parse_row(row):
+    title = (row['title'] or '').strip()
+    if not title or len(title) > 255:
+        raise ValueError('title must be 1 to 255 characters.')
+
+    try:
+        price = Decimal((row['price'] or '').strip())
+    except InvalidOperation:
+        raise ValueError('price is not a number.')
+    if not price.is_finite() or price < 0 or price > MAX_PRICE or price != price.quantize(CENT):
+        raise ValueError(f'price must be between 0 and {MAX_PRICE} with at most 2 decimal places.')
+
+    featured = None
+    if 'featured' in row:
+        featured = (row['featured'] or '').strip().lower()
+        if featured not in TRUE_VALUES | FALSE_VALUES:
+            raise ValueError('featured must be true or false.')
+        featured = featured in TRUE_VALUES
+
+    slug = (row['category'] or '').strip()
+    if not slug_re.match(slug):
+        raise ValueError('category must be a slug.')
+    if len(slug) > 50:
+        raise ValueError('category must be at most 50 characters.')
+
+    category_title = (row.get('category_title') or '').strip()[:255] or slug
+    return title, slug, price.quantize(CENT), featured, category_title
+
+
+def resolve_categories(titles, categories):
+    # titles: slug -> title for the batch. categories maps slug -> id and is kept
+    # across batches; it holds one entry per distinct category in the file.
+    missing = [slug for slug in titles if slug not in categories]
+    if not missing:
+        return
+    # Slugs aren't unique; the oldest category with the slug wins
+    for pk, slug in Category.objects.filter(slug__in=missing).order_by('-id').values_list('id', 'slug'):
+        categories[slug] = pk
+    created = Category.objects.bulk_create([Category(slug=slug, title=titles[slug]) for slug in missing if slug not in categories])
+    for category in created:
+        categories[category.slug] = category.pk
+
+
+def import_batch(batch, categories, result):
+    # batch: (slug, title) -> (price, featured, category title)
+    if not batch:
+        return
+    with transaction.atomic():
+        resolve_categories({slug: category_title for (slug, _), (_, _, category_title) in batch.items()}, categories)
+        rows = {(categories[slug], title): values for (slug, title), values in batch.items()}
+
+        # Looked up by title alone, with the category matched here: with a category_id IN
+        # or an ORDER BY, SQLite reads every item of the categories (or the table) instead
+        # of using the title index. Duplicates aren't prevented; the oldest item wins.
+        existing = {}
+        matches = MenuItem.objects.filter(title__in={title for _, title in rows})
+        for pk, category_id, title, price, featured in matches.values_list('id', 'category_id', 'title', 'price', 'featured'):
+            if (category_id, title) not in rows:
+                continue
+            if (category_id, title) not in existing or pk < existing[(category_id, title)][0]:
+                existing[(category_id, title)] = (pk, price, featured)
+
+        # featured is None throughout a file without the column, which then only sets prices
+        fields = ['price', 'featured'] if next(iter(rows.values()))[1] is not None else ['price']
+        created, updated = [], []
+        for (category_id, title), (price, featured, _) in rows.items():
+            match = existing.get((category_id, title))
+            values = [price, featured][:len(fields)]
+            if match is None:
+                created.append(MenuItem(title=title, price=price, featured=bool(featured), category_id=category_id))
+            elif list(match[1:len(values) + 1]) != values:
+                updated.append((match[0], values))
+            else:
+                result.unchanged += 1
+        MenuItem.objects.bulk_create(created)
+        case_update(MenuItem, fields, updated)
+        result.created += len(created)
+        result.updated += len(updated)
+
+
+def import_menu(lines, batch_size=BATCH_SIZE):
+    # lines: an iterable of CSV text lines, such as an open file. Raises ValueError
+    # for a file without the required columns and csv.Error for malformed CSV.
+    reader = csv.DictReader(lines)
+    missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f'Missing column(s): {", ".join(missing)}.')
+
+    result = ImportResult()
+    categories = {}
+    try:
+        batch = {}
+        for row in reader:
+            try:
+                title, slug, price, featured, category_title = parse_row(row)
+            except ValueError as error:
+                result.error(reader.line_num, str(error))
+                continue
+            # A later row for the same item replaces an earlier one
+            batch[(slug, title)] = (price, featured, category_title)
+            if len(batch) == batch_size:
+                import_batch(batch, categories, result)
+                batch = {}
+        import_batch(batch, categories, result)
+    finally:
+        # Bulk writes don't send the signals that invalidate the menu cache
+        if result.created or result.updated:
+            bump_menu_version()
+    return result
@@ -0,0 +1,19 @@
+from django.core.cache import caches
+from django.core.checks import Error, Tags, register
+
+from .cache import is_process_local
+
+
+# The menu catalogue version, the replica pins and the group id cache are kept in the
+# default cache; a worker that can't see the others' writes serves stale menus and
+# sends a user who just wrote back to a lagging replica.
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if is_process_local(caches['default']):
+        return [Error(
+            'The default cache is process-local, so worker processes do not share the menu version, replica pins and group ids.',
+            hint='Set LITTLELEMON_REDIS_URL or configure a shared backend (Redis, Memcached) in CACHES.',
+            id='LittleLemonAPI.E001',
+        )]
+    return []
@@ -0,0 +1,73 @@
+import heapq
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count
+
+from . import reporting
+from .bulk import case_update
+from .models import Order
+from .roles import DELIVERY_CREW
+
+
+# Automatic assignment of pending orders (no delivery crew, status=False) to the
+# active delivery crew member with the fewest open orders. Loads are counted with
+# one grouped query per run and then kept in a min-heap that is updated as orders
+# are handed out. Orders are assigned oldest first, BATCH_SIZE per transaction.
+
+BATCH_SIZE = 500
+
+
+class CrewLoad:
+    def __init__(self, loads):
+        # (open orders, crew id); ties go to the lowest id
+        self.heap = [(count, crew_id) for crew_id, count in loads.items()]
+        heapq.heapify(self.heap)
+
+    @classmethod
+    def load(cls):
+        crew = User.objects.filter(groups__name=DELIVERY_CREW, is_active=True)
+        loads = dict.fromkeys(crew.values_list('pk', flat=True), 0)
+        open_orders = Order.objects.filter(status=False, delivery_crew__in=crew.values('pk'))
+        for row in open_orders.values('delivery_crew').annotate(orders=Count('id')).order_by():
+            loads[row['delivery_crew']] = row['orders']
+        return cls(loads)
+
+    def __bool__(self):
+        return bool(self.heap)
+
+    def take(self):
+        count, crew_id = self.heap[0]
+        heapq.heapreplace(self.heap, (count + 1, crew_id))
+        return crew_id
+
+
+def pending_orders(order_ids=None):
+    orders = Order.objects.filter(delivery_crew__isnull=True, status=False)
+    if order_ids is not None:
+        orders = orders.filter(pk__in=order_ids)
+    return orders.order_by('date', 'id')
+
+
+def assign_batch(loads, batch_size, order_ids=None):
+    with transaction.atomic():
+        # Skipping locked rows lets concurrent dispatchers take different orders
+        orders = pending_orders(order_ids).select_for_update(skip_locked=True).values('id', 'date')[:batch_size]
+        assignments = [(order['id'], order['date'], loads.take()) for order in orders]
+        if assignments:
+            case_update(Order, ['delivery_crew'], [(pk, [crew_id]) for pk, _, crew_id in assignments], increment='version')
+            reporting.assign_crew([(date, None, crew_id) for _, date, crew_id in assignments])
+    return len(assignments)
+
+
+def dispatch(batch_size=BATCH_SIZE, order_ids=None):
+    # Returns the number of orders assigned
+    loads = CrewLoad.load()
+    if not loads:
+        return 0
+    assigned = 0
+    while True:
+        count = assign_batch(loads, batch_size, order_ids)
+        assigned += count
+        if count < batch_size:
+            return assigned
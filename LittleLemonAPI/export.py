@@ -0,0 +1,46 @@
+import csv
+import json
+
+
+# Row generators for the streaming order export. They consume an order
+# iterator lazily, so memory use doesn't depend on the number of orders.
+
+CSV_HEADER = ['order_id', 'user', 'delivery_crew', 'status', 'total', 'date', 'item', 'quantity', 'unit_price', 'price']
+
+
+class Echo:
+    # File-like object for csv.writer that hands each row back instead of storing it
+    def write(self, value):
+        return value
+
+
+def order_items(order):
+    return [
+        {'name': item.menuitem.title, 'quantity': item.quantity, 'unit_price': str(item.menuitem.price), 'price': str(item.price)}
+        for item in order.orderitem_set.all()
+    ]
+
+
+def ndjson_rows(orders):
+    for order in orders:
+        yield json.dumps({
+            'id': order.id,
+            'user': order.user_id,
+            'delivery_crew': order.delivery_crew_id,
+            'status': order.status,
+            'total': str(order.total),
+            'Date': order.date.strftime('%Y-%m-%d'),
+            'order_items': order_items(order),
+        }) + '\n'
+
+
+def csv_rows(orders):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for order in orders:
+        head = [order.id, order.user_id, order.delivery_crew_id or '', order.status, order.total, order.date.strftime('%Y-%m-%d')]
+        items = order_items(order)
+        if not items:
+            yield writer.writerow(head + [''] * 4)
+        for item in items:
+            yield writer.writerow(head + [item['name'], item['quantity'], item['unit_price'], item['price']])
@@ -0,0 +1,108 @@
+from datetime import date
+from decimal import Decimal
+
+from django.db import connections
+from django.db.models import Q, Value
+from django.db.models.functions import Concat, Lower
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+
+# Filter backends for the menu catalogue and orders. Every query shape they
+# produce is backed by an index (see the model Meta.indexes).
+
+class PrefixSearchFilter(BaseFilterBackend):
+    # Case-insensitive prefix search on the view's search_fields. The match is
+    # written against LOWER(field) so it can use an expression index, which a
+    # LIKE '%term%' never can. The term is lowered by the database too, so both
+    # sides fold alike: SQLite's LOWER() only folds ASCII letters.
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        term = request.query_params.get(self.search_param, '').strip()
+        search_fields = getattr(view, 'search_fields', [])
+        if not term or not search_fields:
+            return queryset
+
+        prefix = Lower(Value(term))
+        postgres = connections[queryset.db].vendor == 'postgresql'
+        condition = Q()
+        for field in search_fields:
+            alias = f'{field}_lower'
+            queryset = queryset.alias(**{alias: Lower(field)})
+            if postgres:
+                # A range would follow the collation's order; LIKE 'term%' is a bytewise
+                # prefix, served by the text_pattern_ops index (migration 0010)
+                condition |= Q(**{f'{alias}__startswith': prefix})
+            else:
+                # SQLite compares text bytewise, so the prefix is a range on the index
+                condition |= Q(**{f'{alias}__gte': prefix, f'{alias}__lt': Concat(prefix, Value('\U0010ffff'))})
+        return queryset.filter(condition)
+
+
+class QueryParamFilter(BaseFilterBackend):
+    # Shared parsing for filters driven by plain query parameters; bad values are a 400.
+
+    def parse(self, params, name, convert):
+        try:
+            return convert(params[name])
+        except (TypeError, ValueError, ArithmeticError):
+            raise ValidationError({name: f'Invalid value: {params[name]}'})
+
+    def to_bool(self, value):
+        if value.lower() in ('true', '1'):
+            return True
+        if value.lower() in ('false', '0'):
+            return False
+        raise ValueError(value)
+
+    def to_price(self, value):
+        price = Decimal(value)
+        if not price.is_finite():
+            raise ValueError(value)
+        return price
+
+    def to_date(self, value):
+        return date.fromisoformat(value)
+
+
+class MenuItemFilter(QueryParamFilter):
+    # ?category=<id>&featured=true&min_price=5&max_price=10
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        if params.get('category'):
+            queryset = queryset.filter(category_id=self.parse(params, 'category', int))
+        if params.get('featured'):
+            # featured=True compiles to a bare WHERE "featured", which SQLite cannot match to an index
+            queryset = queryset.filter(featured__in=[self.parse(params, 'featured', self.to_bool)])
+        if params.get('min_price'):
+            queryset = queryset.filter(price__gte=self.parse(params, 'min_price', self.to_price))
+        if params.get('max_price'):
+            queryset = queryset.filter(price__lte=self.parse(params, 'max_price', self.to_price))
+        return queryset
+
+
+class DateRangeFilter(QueryParamFilter):
+    # ?date_from=2024-05-01&date_to=2024-05-31 on the view's indexed date column
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        if params.get('date_from'):
+            queryset = queryset.filter(date__gte=self.parse(params, 'date_from', self.to_date))
+        if params.get('date_to'):
+            queryset = queryset.filter(date__lte=self.parse(params, 'date_to', self.to_date))
+        return queryset
+
+
+class OrderFilter(DateRangeFilter):
+    # Adds ?status=true|false, served by the Order.status index
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        if params.get('status'):
+            queryset = queryset.filter(status__in=[self.parse(params, 'status', self.to_bool)])
+        return super().filter_queryset(request, queryset, view)
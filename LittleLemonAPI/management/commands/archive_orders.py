@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from LittleLemonAPI import archive
+
+
+class Command(BaseCommand):
+    help = 'Move delivered orders older than ORDER_ARCHIVE_AFTER_DAYS, with their items, to the archive tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Archive delivered orders older than this many days (default: ORDER_ARCHIVE_AFTER_DAYS).')
+        parser.add_argument('--batch-size', type=int, default=archive.BATCH_SIZE, help='Orders moved per transaction.')
+        parser.add_argument('--limit', type=int, help='Stop after about this many orders; run again to continue.')
+
+    def handle(self, *args, **options):
+        archived = archive.archive_orders(options['days'], options['batch_size'], options['limit'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} order(s).'))
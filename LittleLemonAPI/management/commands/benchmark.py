@@ -0,0 +1,68 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from LittleLemonAPI.benchmarks import BENCHMARKS, Results
+
+
+class Command(BaseCommand):
+    help = 'Run LittleLemonAPI benchmarks against a throwaway test database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help=f'Benchmarks to run (default: all). Available: {", ".join(sorted(BENCHMARKS))}')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed iterations per case.')
+        parser.add_argument('--users', type=int, default=200, help='Customers to seed.')
+        parser.add_argument('--menu-items', type=int, default=500, help='Menu items to seed.')
+        parser.add_argument('--orders', type=int, default=2000, help='Orders to seed.')
+        parser.add_argument('--items-per-order', type=int, default=3, help='Items per seeded order.')
+        parser.add_argument('--concurrency', type=int, default=200, help='Concurrent clients for the asgi benchmark; each makes --repeat requests.')
+        parser.add_argument('--save-baseline', metavar='PATH', help='Write the results to PATH as JSON.')
+        parser.add_argument('--baseline', metavar='PATH', help='Fail if any case runs more SQL queries than in this baseline.')
+        parser.add_argument('--max-slowdown', type=float, help='With --baseline, also fail if a p95 exceeds the baseline p95 times this factor.')
+
+    def handle(self, *args, **options):
+        names = options['names'] or sorted(BENCHMARKS)
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            raise CommandError(f'Unknown benchmark(s): {", ".join(unknown)}')
+
+        results = {}
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            for name in names:
+                self.stdout.write(self.style.MIGRATE_HEADING(name))
+                results[name] = Results(self.stdout)
+                BENCHMARKS[name](results[name], options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        results = {name: collected.cases for name, collected in results.items()}
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as baseline:
+                json.dump(results, baseline, indent=2, sort_keys=True)
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['max_slowdown'])
+
+    def compare(self, results, path, max_slowdown):
+        with open(path) as baseline_file:
+            baseline = json.load(baseline_file)
+
+        regressions = []
+        for name, cases in results.items():
+            for label, stats in cases.items():
+                expected = baseline.get(name, {}).get(label)
+                if expected is None:
+                    self.stdout.write(f'{name} / {label}: not in baseline')
+                    continue
+                if stats['queries'] is not None and expected['queries'] is not None and stats['queries'] > expected['queries']:
+                    regressions.append(f'{name} / {label}: {stats["queries"]} queries, baseline {expected["queries"]}')
+                if max_slowdown and stats['p95'] > expected['p95'] * max_slowdown:
+                    regressions.append(f'{name} / {label}: p95 {stats["p95"]:.2f}ms, baseline {expected["p95"]:.2f}ms')
+
+        if regressions:
+            raise CommandError('Benchmark regressions:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from LittleLemonAPI import dispatch
+
+
+class Command(BaseCommand):
+    help = 'Assign pending orders to the delivery crew members with the fewest open orders.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=dispatch.BATCH_SIZE, help='Orders assigned per transaction.')
+        parser.add_argument('--loop', action='store_true', help='Keep dispatching until interrupted.')
+        parser.add_argument('--interval', type=float, default=5, help='With --loop, seconds to wait between runs.')
+
+    def handle(self, *args, **options):
+        while True:
+            assigned = dispatch.dispatch(options['batch_size'])
+            if assigned or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f'Assigned {assigned} order(s).'))
+            if not options['loop']:
+                return
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,28 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from LittleLemonAPI import catalogue
+
+
+class Command(BaseCommand):
+    help = 'Create and update menu items and categories from a CSV file with title, price, category and optional featured and category_title columns.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file to import.')
+        parser.add_argument('--batch-size', type=int, default=catalogue.BATCH_SIZE, help='Rows written per batch.')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as csv_file:
+                result = catalogue.import_menu(csv_file, options['batch_size'])
+        except (OSError, UnicodeDecodeError, ValueError, csv.Error) as error:
+            raise CommandError(f'Import failed: {error}')
+
+        for error in result.errors:
+            self.stderr.write(f'Line {error["line"]}: {error["message"]}')
+        if result.invalid > len(result.errors):
+            self.stderr.write(f'... and {result.invalid - len(result.errors)} more invalid row(s).')
+        self.stdout.write(self.style.SUCCESS(
+            f'{result.created} created, {result.updated} updated, {result.unchanged} unchanged, {result.invalid} invalid.'
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from LittleLemonAPI import reporting
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily sales rollup tables from Order and OrderItem.'
+
+    def handle(self, *args, **options):
+        reporting.rebuild()
+        self.stdout.write(self.style.SUCCESS('Sales rollups rebuilt.'))
@@ -0,0 +1,127 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+# In-memory request metrics, aggregated per process into histograms and
+# exposed in the Prometheus text format by MetricsView. RequestMetricsMiddleware
+# sets a RequestMetrics for every request; queries are added to it by
+# record_query and serializer time by TimedSerializerMixin.
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+HISTOGRAMS = {
+    'littlelemon_request_duration_seconds': ('Wall time of the request.', SECONDS_BUCKETS),
+    'littlelemon_request_queries': ('SQL queries run by the request.', COUNT_BUCKETS),
+    'littlelemon_request_db_seconds': ('Time spent executing SQL.', SECONDS_BUCKETS),
+    'littlelemon_request_serializer_seconds': ('Time spent in serializers.', SECONDS_BUCKETS),
+    'littlelemon_response_bytes': ('Size of the response body.', BYTES_BUCKETS),
+}
+
+current = ContextVar('littlelemon_request_metrics', default=None)
+
+
+class RequestMetrics:
+    max_statements = 100
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.statements = []
+
+    def record_query(self, sql, duration):
+        self.queries += 1
+        self.db_time += duration
+        if len(self.statements) < self.max_statements:
+            self.statements.append((duration, sql))
+
+
+@contextmanager
+def serializer_section():
+    metrics = current.get()
+    if metrics is None or metrics.serializer_depth:
+        # Nested serializers are already inside the outer one's timing
+        yield
+        return
+    metrics.serializer_depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_time += time.perf_counter() - start
+        metrics.serializer_depth -= 1
+
+
+def record_query(execute, sql, params, many, context):
+    # Installed on every database connection; records into the current request's metrics, if any
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(sql, time.perf_counter() - start)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    # connection_created receiver. A wrapper installed per connection, rather than
+    # per request, also sees the queries the async ORM runs in worker threads.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def observe(self, view, values):
+        with self.lock:
+            for name, value in values.items():
+                key = (name, view)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(HISTOGRAMS[name][1])
+                self.histograms[key].observe(value)
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, (help_text, buckets) in HISTOGRAMS.items():
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for (metric, view), histogram in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{view="{view}"}} {histogram.sum}')
+                    lines.append(f'{name}_count{{view="{view}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
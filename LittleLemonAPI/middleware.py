@@ -0,0 +1,180 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from rest_framework.permissions import SAFE_METHODS
+
+from . import routers
+from .metrics import RequestMetrics, current, registry
+
+
+logger = logging.getLogger('LittleLemonAPI.slow_requests')
+
+
+class RequestMetricsMiddleware:
+    # Records wall time, SQL count and time, serializer time and response size
+    # for every request that resolves to a view, and logs the SQL of requests
+    # slower than SLOW_REQUEST_THRESHOLD_MS. Streaming responses are measured
+    # through the end of their body.
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics, token, start = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, metrics, start)
+
+    async def __acall__(self, request):
+        metrics, token, start = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, metrics, start)
+
+    def start(self):
+        metrics = RequestMetrics()
+        return metrics, current.set(metrics), time.perf_counter()
+
+    def finish(self, request, response, metrics, start):
+        view = self.view_name(request)
+        if not view:
+            return response
+        if response.streaming:
+            # The body, and the queries that produce it, only run as it is sent, so
+            # the request is recorded once the stream is exhausted or closed
+            stream = self.astream if response.is_async else self.stream
+            response.streaming_content = stream(response.streaming_content, request, view, metrics, start)
+        else:
+            self.record(request, view, metrics, start, len(response.content))
+        return response
+
+    def stream(self, chunks, request, view, metrics, start):
+        size = 0
+        chunks = iter(chunks)
+        try:
+            while True:
+                token = current.set(metrics)
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    return
+                finally:
+                    current.reset(token)
+                size += len(chunk)
+                yield chunk
+        finally:
+            self.record(request, view, metrics, start, size)
+
+    async def astream(self, chunks, request, view, metrics, start):
+        size = 0
+        chunks = aiter(chunks)
+        try:
+            while True:
+                token = current.set(metrics)
+                try:
+                    chunk = await anext(chunks)
+                except StopAsyncIteration:
+                    return
+                finally:
+                    current.reset(token)
+                size += len(chunk)
+                yield chunk
+        finally:
+            self.record(request, view, metrics, start, size)
+
+    def record(self, request, view, metrics, start, size):
+        duration = time.perf_counter() - start
+        registry.observe(view, {
+            'littlelemon_request_duration_seconds': duration,
+            'littlelemon_request_queries': metrics.queries,
+            'littlelemon_request_db_seconds': metrics.db_time,
+            'littlelemon_request_serializer_seconds': metrics.serializer_time,
+            'littlelemon_response_bytes': size,
+        })
+        threshold = getattr(settings, 'SLOW_REQUEST_THRESHOLD_MS', None)
+        if threshold is not None and duration * 1000 >= threshold:
+            self.log_slow_request(request, view, duration, metrics)
+
+    def view_name(self, request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return None
+        view = getattr(match.func, 'view_class', None) or match.func
+        return view.__name__
+
+    def log_slow_request(self, request, view, duration, metrics):
+        statements = '\n'.join(f'  {elapsed * 1000:.2f}ms  {sql}' for elapsed, sql in sorted(metrics.statements, reverse=True))
+        logger.warning(
+            'Slow request: %s %s (%s) took %.2fms, %d queries in %.2fms, serializers %.2fms\n%s',
+            request.method, request.get_full_path(), view, duration * 1000,
+            metrics.queries, metrics.db_time * 1000, metrics.serializer_time * 1000, statements,
+        )
+
+
+class ReplicaRoutingMiddleware:
+    # Lets safe-method requests read from a replica (see routers.py), and pins
+    # users to the primary for REPLICA_PIN_SECONDS after a successful write.
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = routers.current.set(self.reads(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.current.reset(token)
+        self.pin_writer(request, response)
+        return response
+
+    async def __acall__(self, request):
+        token = routers.current.set(self.reads(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.current.reset(token)
+        if request.method not in SAFE_METHODS:
+            # request.user may still be the lazy session user, which queries the database
+            await sync_to_async(self.pin_writer)(request, response)
+        return response
+
+    def reads(self, request):
+        return routers.ReplicaReads(request) if request.method in SAFE_METHODS else None
+
+    def pin_writer(self, request, response):
+        if request.method in SAFE_METHODS or response.status_code >= 400:
+            return
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            routers.pin_to_primary(user)
+
+
+class ThresholdGZipMiddleware(GZipMiddleware):
+    # GZipMiddleware for bodies of at least GZIP_MIN_LENGTH bytes; below that the
+    # savings are not worth the CPU. Streaming responses are always compressed.
+
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < getattr(settings, 'GZIP_MIN_LENGTH', 200):
+            return response
+        return super().process_response(request, response)
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:03
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0003_cart_price'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='menuitem',
+            index=models.Index(django.db.models.functions.text.Lower('title'), name='menuitem_title_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menuitem',
+            index=models.Index(fields=['category', 'price'], name='menuitem_category_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menuitem',
+            index=models.Index(fields=['featured', 'price'], name='menuitem_featured_price_idx'),
+        ),
+    ]
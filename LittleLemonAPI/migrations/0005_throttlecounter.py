@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0004_menuitem_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThrottleCounter',
+            fields=[
+                ('key', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('window', models.BigIntegerField()),
+                ('hits', models.IntegerField()),
+            ],
+        ),
+    ]
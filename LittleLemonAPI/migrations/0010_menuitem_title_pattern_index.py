@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+# PostgreSQL only: PrefixSearchFilter matches LOWER(title) LIKE 'term%' there, which
+# an index can only serve with text_pattern_ops unless the database collation is C.
+# SQLite keeps using menuitem_title_lower_idx.
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    MenuItem = apps.get_model('LittleLemonAPI', 'MenuItem')
+    quote = schema_editor.quote_name
+    schema_editor.execute(
+        f'CREATE INDEX menuitem_title_lower_pattern_idx ON {quote(MenuItem._meta.db_table)} (LOWER({quote("title")}) text_pattern_ops)'
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS menuitem_title_lower_pattern_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0009_archived_orders'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
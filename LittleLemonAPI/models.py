@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Lower
 from django.contrib.auth.models import User
 
 # Create your models here.
@@ -12,6 +13,14 @@ class MenuItem(models.Model):
     featured = models.BooleanField(db_index = True)
     category = models.ForeignKey(Category, on_delete = models.PROTECT)
 
+    class Meta:
+        # Cover the /menu-items filters combined with the default price ordering
+        indexes = [
+            models.Index(Lower('title'), name = 'menuitem_title_lower_idx'),
+            models.Index(fields = ['category', 'price'], name = 'menuitem_category_price_idx'),
+            models.Index(fields = ['featured', 'price'], name = 'menuitem_featured_price_idx'),
+        ]
+
 class Cart(models.Model):
     user = models.ForeignKey(User, on_delete = models.CASCADE)
     menuitem = models.ForeignKey(MenuItem, on_delete = models.CASCADE)
@@ -28,9 +37,20 @@ class Cart(models.Model):
 class Order(models.Model):
     user = models.ForeignKey(User, on_delete = models.CASCADE)
     delivery_crew = models.ForeignKey(User, on_delete = models.SET_NULL, related_name = "delivery_crew", null = True)
-    status = models.BooleanField(db_index = True, default = 0)
+    status = models.BooleanField(default = 0)
     total = models.DecimalField(max_digits = 6, decimal_places = 2)
     date = models.DateField(db_index = True, auto_now=True)
+    # Bumped by every update; sent as the ETag of /orders/<id> for If-Match (see OrderView)
+    version = models.PositiveIntegerField(default = 1)
+
+    class Meta:
+        # One per role's /orders list query, each ending in the newest-first ordering.
+        # status_date also serves status-only lookups, so status has no index of its own.
+        indexes = [
+            models.Index(fields = ['user', 'date', 'id'], name = 'order_user_date_idx'),
+            models.Index(fields = ['delivery_crew', 'status', 'date', 'id'], name = 'order_crew_status_date_idx'),
+            models.Index(fields = ['status', 'date', 'id'], name = 'order_status_date_idx'),
+        ]
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete = models.CASCADE)
@@ -40,4 +60,66 @@ class OrderItem(models.Model):
     price = models.DecimalField(max_digits = 6, decimal_places = 2)
 
     class Meta:
-        unique_together = ('order', 'menuitem')
\ No newline at end of file
+        unique_together = ('order', 'menuitem')
+
+# Delivered orders moved out of Order/OrderItem by archive.py, keeping their ids.
+# The item relation has OrderItem's accessor name, so the order serializers read
+# archived orders unchanged.
+
+class ArchivedOrder(models.Model):
+    id = models.BigIntegerField(primary_key = True)
+    user = models.ForeignKey(User, on_delete = models.CASCADE, related_name = "archived_orders")
+    delivery_crew = models.ForeignKey(User, on_delete = models.SET_NULL, related_name = "archived_deliveries", null = True)
+    status = models.BooleanField(default = 1)
+    total = models.DecimalField(max_digits = 6, decimal_places = 2)
+    date = models.DateField(db_index = True)
+    version = models.PositiveIntegerField(default = 1)
+    archived_at = models.DateTimeField(auto_now_add = True)
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key = True)
+    order = models.ForeignKey(ArchivedOrder, on_delete = models.CASCADE, related_name = "orderitem_set")
+    menuitem = models.ForeignKey(MenuItem, on_delete = models.CASCADE, related_name = "archived_orderitems")
+    quantity = models.SmallIntegerField()
+    unit_price = models.DecimalField(max_digits = 6, decimal_places = 2)
+    price = models.DecimalField(max_digits = 6, decimal_places = 2)
+
+class ThrottleCounter(models.Model):
+    # Fixed-window request counters shared by every worker process (see throttling.py)
+    key = models.CharField(max_length = 255, primary_key = True)
+    window = models.BigIntegerField()
+    hits = models.IntegerField()
+
+# Daily sales rollups, maintained incrementally by reporting.py and rebuilt
+# from scratch by the rebuild_sales_rollups management command.
+
+class DailySales(models.Model):
+    date = models.DateField(unique = True)
+    orders = models.IntegerField(default = 0)
+    revenue = models.DecimalField(max_digits = 14, decimal_places = 2, default = 0)
+
+class DailyMenuItemSales(models.Model):
+    date = models.DateField()
+    menuitem = models.ForeignKey(MenuItem, on_delete = models.CASCADE)
+    quantity = models.IntegerField(default = 0)
+    revenue = models.DecimalField(max_digits = 14, decimal_places = 2, default = 0)
+
+    class Meta:
+        unique_together = ('date', 'menuitem')
+
+class DailyCategorySales(models.Model):
+    date = models.DateField()
+    category = models.ForeignKey(Category, on_delete = models.CASCADE)
+    quantity = models.IntegerField(default = 0)
+    revenue = models.DecimalField(max_digits = 14, decimal_places = 2, default = 0)
+
+    class Meta:
+        unique_together = ('date', 'category')
+
+class DailyCrewOrders(models.Model):
+    date = models.DateField()
+    delivery_crew = models.ForeignKey(User, on_delete = models.CASCADE)
+    orders = models.IntegerField(default = 0)
+
+    class Meta:
+        unique_together = ('date', 'delivery_crew')
@@ -0,0 +1,127 @@
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, Cursor, _reverse_ordering
+
+
+# Keyset pagination: the cursor stores the values of every ordering column of the
+# last row sent, and the next page is fetched with a row-value comparison on them.
+# DRF's CursorPagination only keys on the first column and falls back to OFFSET on
+# ties, which makes deep pages of orders sharing the same date a table scan.
+# Ordering columns must be non-null and the ordering must end in the primary key.
+
+class LittleLemonCursorPagination(CursorPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('id',)
+
+    def get_ordering(self, request, queryset, view):
+        ordering = tuple(super().get_ordering(request, queryset, view))
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            # Break ties in the same direction as the last column so one index serves the whole ordering.
+            ordering += ('-id' if ordering[-1].startswith('-') else 'id',)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page = self.page_queryset(queryset, request, view)
+        if page is None:
+            return None
+        return self.set_page(list(page))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page = self.page_queryset(queryset, request, view)
+        if page is None:
+            return None
+        return self.set_page([row async for row in page])
+
+    def page_queryset(self, queryset, request, view):
+        # The lazy queryset for the requested page plus one row to detect a following page
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            reverse, position = False, None
+        else:
+            _, reverse, position = self.cursor
+
+        ordering = _reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.after_position(ordering, self.decode_position(position, queryset.model)))
+        self.reverse, self.position = reverse, position
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        reverse, position = self.reverse, self.position
+        self.page = results[:self.page_size]
+        has_following = len(results) > len(self.page)
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, has_following
+        else:
+            self.has_next, self.has_previous = has_following, position is not None
+        return self.page
+
+    def after_position(self, ordering, values):
+        condition = Q()
+        for index, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = '__lt' if field.startswith('-') else '__gt'
+            ties = {ordering[i].lstrip('-'): values[i] for i in range(index)}
+            condition |= Q(**ties, **{name + lookup: values[index]})
+        return condition
+
+    def encode_position(self, instance):
+        return json.dumps([str(self._get_position_from_instance(instance, [field])) for field in self.ordering])
+
+    def decode_position(self, position, model):
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        # The cursor comes from the client: a value the column can't hold would
+        # otherwise fail in the query
+        return [self.decode_value(model, field.lstrip('-'), value) for field, value in zip(self.ordering, values)]
+
+    def decode_value(self, model, name, value):
+        try:
+            field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # An annotation; the database compares it as sent
+            return value
+        if value is None or isinstance(value, (list, dict)):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            return field.to_python(value)
+        except ValidationError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        position = self.encode_position(self.page[-1]) if self.page else self.position
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        position = self.encode_position(self.page[0]) if self.page else self.position
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+
+class OrderCursorPagination(LittleLemonCursorPagination):
+    ordering = ('-date', '-id')
+
+
+class MenuItemCursorPagination(LittleLemonCursorPagination):
+    ordering = ('price', 'id')
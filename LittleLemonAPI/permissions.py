@@ -1,11 +1,12 @@
 from rest_framework import permissions
+from .roles import is_manager, is_delivery_crew
 
 class IsManager(permissions.BasePermission):
     def has_permission(self, request, view):
-       if request.user.groups.filter(name='manager').exists():
+       if is_manager(request):
             return True
 
 class IsDeliveryCrew(permissions.BasePermission):
     def has_permission(self, request, view):
-       if request.user.groups.filter(name='delivery-crew').exists():
-            return True
\ No newline at end of file
+       if is_delivery_crew(request):
+            return True
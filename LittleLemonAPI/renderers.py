@@ -0,0 +1,36 @@
+from decimal import Decimal
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# JSON renderer backed by orjson when it is installed. The output matches DRF's
+# compact JSONRenderer, except that stray Decimals are written as strings (as the
+# serializers already do for prices) instead of lossy floats.
+
+encoder = JSONEncoder()
+
+
+def default(obj):
+    if isinstance(obj, Decimal):
+        return str(obj)
+    return encoder.default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        renderer_context = renderer_context or {}
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context) is not None:
+            # Pretty-printing was asked for; it is rare enough to leave to DRF
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        # Like DRF, escape the two line terminators that are valid JSON but not JavaScript
+        return orjson.dumps(data, default=default, option=self.options).replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
@@ -0,0 +1,115 @@
+from collections import defaultdict
+
+from django.db import connections, router, transaction
+from django.db.models import Count, Sum
+
+from .models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem, DailySales, DailyMenuItemSales, DailyCategorySales, DailyCrewOrders
+
+
+# Incremental maintenance of the daily sales rollups. Every change is a single
+# multi-row INSERT ... ON CONFLICT DO UPDATE per rollup table, which adds the
+# deltas to the stored counters atomically.
+
+def increment(model, keys, values, rows):
+    totals = defaultdict(lambda: [0] * len(values))
+    for row in rows:
+        key = tuple(row[name] for name in keys)
+        for index, name in enumerate(values):
+            totals[key][index] += row[name]
+    if not totals:
+        return
+
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    fields = [model._meta.get_field(name) for name in keys + values]
+    columns = ', '.join(quote(field.column) for field in fields)
+    conflict = ', '.join(quote(field.column) for field in fields[:len(keys)])
+    updates = ', '.join(f'{quote(field.column)} = {table}.{quote(field.column)} + excluded.{quote(field.column)}' for field in fields[len(keys):])
+    placeholders = ', '.join(['(' + ', '.join(['%s'] * len(fields)) + ')'] * len(totals))
+
+    params = []
+    for key, deltas in totals.items():
+        params += [field.get_db_prep_save(value, connection) for field, value in zip(fields, key + tuple(deltas))]
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {table} ({columns}) VALUES {placeholders} ON CONFLICT ({conflict}) DO UPDATE SET {updates}', params)
+
+
+def load_lines(order_ids):
+    lines = defaultdict(list)
+    rows = OrderItem.objects.filter(order_id__in=order_ids).values('order_id', 'menuitem_id', 'menuitem__category_id', 'quantity', 'price')
+    for row in rows:
+        lines[row['order_id']].append({
+            'menuitem_id': row['menuitem_id'],
+            'category_id': row['menuitem__category_id'],
+            'quantity': row['quantity'],
+            'price': row['price'],
+        })
+    return lines
+
+
+def apply_orders(orders, lines, sign=1):
+    # Adds (sign=1) or removes (sign=-1) orders from the rollups. lines maps
+    # order id to dicts with menuitem_id, category_id, quantity and price.
+    with transaction.atomic():
+        increment(DailySales, ['date'], ['orders', 'revenue'], (
+            {'date': order.date, 'orders': sign, 'revenue': sign * order.total}
+            for order in orders
+        ))
+        items = [(order.date, line) for order in orders for line in lines.get(order.id, [])]
+        increment(DailyMenuItemSales, ['date', 'menuitem'], ['quantity', 'revenue'], (
+            {'date': date, 'menuitem': line['menuitem_id'], 'quantity': sign * line['quantity'], 'revenue': sign * line['price']}
+            for date, line in items
+        ))
+        increment(DailyCategorySales, ['date', 'category'], ['quantity', 'revenue'], (
+            {'date': date, 'category': line['category_id'], 'quantity': sign * line['quantity'], 'revenue': sign * line['price']}
+            for date, line in items
+        ))
+        increment(DailyCrewOrders, ['date', 'delivery_crew'], ['orders'], (
+            {'date': order.date, 'delivery_crew': order.delivery_crew_id, 'orders': sign}
+            for order in orders if order.delivery_crew_id
+        ))
+
+
+def assign_crew(assignments):
+    # assignments: (date, previous crew id or None, new crew id or None) per order
+    rows = []
+    for date, previous, new in assignments:
+        if previous == new:
+            continue
+        if previous:
+            rows.append({'date': date, 'delivery_crew': previous, 'orders': -1})
+        if new:
+            rows.append({'date': date, 'delivery_crew': new, 'orders': 1})
+    increment(DailyCrewOrders, ['date', 'delivery_crew'], ['orders'], rows)
+
+
+def rebuild():
+    # From the live and the archived orders; archived orders are still sales
+    batch_size = 1000
+    with transaction.atomic():
+        for model in (DailySales, DailyMenuItemSales, DailyCategorySales, DailyCrewOrders):
+            model.objects.all().delete()
+        for orders, items in ((Order, OrderItem), (ArchivedOrder, ArchivedOrderItem)):
+            rollups = [
+                (DailySales, ['date'], ['orders', 'revenue'],
+                    orders.objects.values('date').annotate(orders=Count('id'), revenue=Sum('total')), {}),
+                (DailyMenuItemSales, ['date', 'menuitem'], ['quantity', 'revenue'],
+                    items.objects.values('order__date', 'menuitem_id').annotate(quantity=Sum('quantity'), revenue=Sum('price')),
+                    {'order__date': 'date', 'menuitem_id': 'menuitem'}),
+                (DailyCategorySales, ['date', 'category'], ['quantity', 'revenue'],
+                    items.objects.values('order__date', 'menuitem__category_id').annotate(quantity=Sum('quantity'), revenue=Sum('price')),
+                    {'order__date': 'date', 'menuitem__category_id': 'category'}),
+                (DailyCrewOrders, ['date', 'delivery_crew'], ['orders'],
+                    orders.objects.filter(delivery_crew__isnull=False).values('date', 'delivery_crew_id').annotate(orders=Count('id')),
+                    {'delivery_crew_id': 'delivery_crew'}),
+            ]
+            # Added with increment(), as both sources can have rows for the same day
+            for model, keys, values, rows, renames in rollups:
+                batch = []
+                for row in rows.order_by().iterator(chunk_size=batch_size):
+                    batch.append({renames.get(name, name): value for name, value in row.items()})
+                    if len(batch) == batch_size:
+                        increment(model, keys, values, batch)
+                        batch = []
+                increment(model, keys, values, batch)
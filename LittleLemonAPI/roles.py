@@ -0,0 +1,67 @@
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+
+
+# Role resolution: the group names of the requesting user are loaded with a
+# single query and kept on the request, so permissions and views share them.
+
+MANAGER = 'manager'
+DELIVERY_CREW = 'delivery-crew'
+
+
+def load_roles(user):
+    if not user or not user.is_authenticated:
+        return frozenset()
+    return frozenset(user.groups.values_list('name', flat=True))
+
+
+def get_roles(request):
+    roles = getattr(request, '_littlelemon_roles', None)
+    if roles is None:
+        roles = load_roles(request.user)
+        request._littlelemon_roles = roles
+    return roles
+
+
+async def aget_roles(request):
+    roles = getattr(request, '_littlelemon_roles', None)
+    if roles is None:
+        user = request.user
+        if not user or not user.is_authenticated:
+            roles = frozenset()
+        else:
+            roles = frozenset([name async for name in user.groups.values_list('name', flat=True)])
+        request._littlelemon_roles = roles
+    return roles
+
+
+def clear_roles(request):
+    # Call after changing group memberships that may include the requesting user.
+    request._littlelemon_roles = None
+
+
+def is_manager(request):
+    return MANAGER in get_roles(request)
+
+
+def is_delivery_crew(request):
+    return DELIVERY_CREW in get_roles(request)
+
+
+# Group ids by name, cached until the group is renamed or deleted (see signals.py)
+
+def group_cache_key(name):
+    return f'group-id:{name}'
+
+
+def group_id(name):
+    pk = cache.get(group_cache_key(name))
+    if pk is None:
+        pk = Group.objects.get_or_create(name=name)[0].pk
+        cache.set(group_cache_key(name), pk, None)
+    return pk
+
+
+def forget_group(sender, instance, **kwargs):
+    # The name a renamed group had is not known here, so the role groups are always dropped
+    cache.delete_many([group_cache_key(name) for name in {instance.name, MANAGER, DELIVERY_CREW}])
@@ -0,0 +1,101 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+
+# Read-replica routing. ReplicaRoutingMiddleware sets a ReplicaReads for
+# safe-method requests; while one is set, reads of LittleLemonAPI models go to a
+# random DATABASE_REPLICAS alias unless the user wrote recently. Everything else,
+# and every write, goes to the primary. Pins live in the cache, so processes only
+# share them with a shared cache backend.
+
+current = ContextVar('littlelemon_replica_reads', default=None)
+
+
+def pin_key(user_id):
+    return f'primary-pin:{user_id}'
+
+
+def pin_to_primary(user):
+    cache.set(pin_key(user.pk), True, getattr(settings, 'REPLICA_PIN_SECONDS', 5))
+
+
+@contextmanager
+def primary_reads():
+    # Reads inside the block go to the primary: for results that are cached and
+    # served to other users, who may be pinned to the primary themselves
+    token = current.set(None)
+    try:
+        yield
+    finally:
+        current.reset(token)
+
+
+class ReplicaReads:
+    def __init__(self, request):
+        self.request = request
+        self.pinned = {}
+
+    def allowed(self):
+        # The user is read at query time: DRF authenticates inside the view and
+        # sets request.user then, after the middleware has run
+        user = getattr(self.request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return True
+        if user.pk not in self.pinned:
+            self.pinned[user.pk] = cache.get(pin_key(user.pk), False)
+        return not self.pinned[user.pk]
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != 'LittleLemonAPI':
+            return None
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        reads = current.get()
+        if replicas and reads is not None and reads.allowed():
+            return random.choice(replicas)
+        # Explicitly, so instances loaded from a replica don't pull related reads there
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Explicitly, so saving an instance loaded from a replica writes to the primary
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same data
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas get their schema through replication
+        if db in getattr(settings, 'DATABASE_REPLICAS', []):
+            return False
+        return None
+
+
+class ThrottleRouter:
+    # ThrottleCounter, and nothing else, lives in THROTTLE_DATABASE when one is set
+    def route(self, model):
+        alias = getattr(settings, 'THROTTLE_DATABASE', None)
+        if alias and model._meta.label == 'LittleLemonAPI.ThrottleCounter':
+            return alias
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self.route(model)
+
+    def db_for_write(self, model, **hints):
+        return self.route(model)
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        alias = getattr(settings, 'THROTTLE_DATABASE', None)
+        if not alias:
+            return None
+        counter = app_label == 'LittleLemonAPI' and model_name == 'throttlecounter'
+        if db == alias or counter:
+            return db == alias and counter
+        return None
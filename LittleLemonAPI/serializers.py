@@ -1,22 +1,32 @@
 from rest_framework import serializers
+from rest_framework.utils.serializer_helpers import ReturnList
 from .models import Category, MenuItem, Cart, Order, OrderItem
 from django.contrib.auth.models import User
 from datetime import datetime
+from decimal import Decimal
+from .metrics import serializer_section
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class TimedSerializerMixin():
+    # Adds the time spent building representations to the request metrics
+    def to_representation(self, instance):
+        with serializer_section():
+            return super().to_representation(instance)
+
+
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'title']
 
 
-class MenuItemSerializer(serializers.ModelSerializer):
+class MenuItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = MenuItem
         fields = ['id', 'title', 'price', 'category', 'featured']
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     Date_Joined = serializers.SerializerMethodField()
     date_joined = serializers.DateTimeField(write_only=True, default=datetime.now)
     email = serializers.EmailField(required=False)
@@ -29,7 +39,7 @@ class UserSerializer(serializers.ModelSerializer):
         return obj.date_joined.strftime('%Y-%m-%d')
 
 
-class UserCartSerializer(serializers.ModelSerializer):
+class UserCartSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     unit_price = serializers.DecimalField(max_digits=6, decimal_places=2, source='menuitem.price', read_only=True)
     name = serializers.CharField(source='menuitem.title', read_only=True)
 
@@ -41,7 +51,34 @@ class UserCartSerializer(serializers.ModelSerializer):
         }
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class CartBatchLineSerializer(serializers.Serializer):
+    menuitem = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, max_value=32767)
+
+
+class GroupMembersSerializer(serializers.Serializer):
+    usernames = serializers.ListField(child=serializers.CharField(max_length=150), required=False)
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
+
+    def validate(self, data):
+        if(not data.get('usernames') and not data.get('ids')):
+            raise serializers.ValidationError('Give a list of usernames or ids.')
+        return data
+
+
+class OrderBulkOperationSerializer(serializers.Serializer):
+    order_id = serializers.IntegerField(min_value=1)
+    delivery_crew = serializers.IntegerField(min_value=1, required=False)
+    status = serializers.BooleanField(required=False)
+    version = serializers.IntegerField(min_value=1, required=False)
+
+    def validate(self, data):
+        if(('delivery_crew' in data) == ('status' in data)):
+            raise serializers.ValidationError('Give exactly one of delivery_crew and status.')
+        return data
+
+
+class OrderItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     unit_price = serializers.DecimalField(max_digits=6, decimal_places=2, source='menuitem.price', read_only=True)
     price = serializers.DecimalField(max_digits=6, decimal_places=2, read_only=True)
     name = serializers.CharField(source='menuitem.title', read_only=True)
@@ -54,7 +91,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
         }
 
 
-class UserOrdersSerializer(serializers.ModelSerializer):
+class UserOrdersSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     Date = serializers.SerializerMethodField()
     date = serializers.DateTimeField(write_only=True, default=datetime.now)
     order_items = serializers.SerializerMethodField()
@@ -70,6 +107,98 @@ class UserOrdersSerializer(serializers.ModelSerializer):
         return obj.date.strftime('%Y-%m-%d')
 
     def get_order_items(self, obj):
-        order_items = OrderItem.objects.filter(order=obj)
+        order_items = obj.orderitem_set.all()
         serializer = OrderItemSerializer(order_items, many=True, context={'request': self.context['request']})
-        return serializer.data
\ No newline at end of file
+        return serializer.data
+
+# Compact read-only serializers for the large listings. They select .values()
+# rows instead of model instances and build each representation directly, key for
+# key and value for value the same as the ModelSerializer they stand in for, so
+# the rendered JSON is byte-identical. Views opt in with CompactListMixin.
+
+CENT = Decimal('0.01')
+
+
+def decimal_string(value):
+    # DecimalField(decimal_places=2).to_representation
+    return '{:f}'.format(value.quantize(CENT))
+
+
+class CompactSerializer():
+    columns = ()
+
+    def __init__(self, instance=None, many=True, context=None, **kwargs):
+        self.instance = instance
+        self.context = context or {}
+        self.loaded = False
+
+    @classmethod
+    def values(cls, queryset):
+        return queryset.prefetch_related(None).values(*cls.columns)
+
+    def load(self):
+        # Fetch anything nested in the rows; aload() does it with the async ORM
+        self.loaded = True
+
+    async def aload(self):
+        self.loaded = True
+
+    @property
+    def data(self):
+        if not self.loaded:
+            self.load()
+        with serializer_section():
+            return ReturnList([self.to_representation(row) for row in self.instance], serializer=self)
+
+
+class CompactMenuItemSerializer(CompactSerializer):
+    # MenuItemSerializer
+    columns = ('id', 'title', 'price', 'category', 'featured')
+
+    def to_representation(self, row):
+        return {
+            'id': row['id'],
+            'title': row['title'],
+            'price': decimal_string(row['price']),
+            'category': row['category'],
+            'featured': row['featured'],
+        }
+
+
+class CompactOrderSerializer(CompactSerializer):
+    # UserOrdersSerializer with its nested OrderItemSerializer
+    columns = ('id', 'user', 'delivery_crew', 'status', 'total', 'date')
+    item_columns = ('order_id', 'menuitem__title', 'quantity', 'menuitem__price', 'price')
+
+    def items(self):
+        # The same query as OrderGraphMixin's prefetch, so items come back in the same order
+        ids = [row['id'] for row in self.instance]
+        return OrderItem.objects.select_related('menuitem').filter(order__in=ids).values_list(*self.item_columns)
+
+    def attach(self, items):
+        self.order_items = {}
+        for order_id, name, quantity, unit_price, price in items:
+            self.order_items.setdefault(order_id, []).append({
+                'name': name,
+                'quantity': quantity,
+                'unit_price': decimal_string(unit_price),
+                'price': decimal_string(price),
+            })
+        self.loaded = True
+
+    def load(self):
+        self.attach(self.items() if self.instance else [])
+
+    async def aload(self):
+        self.attach([item async for item in self.items()] if self.instance else [])
+
+    def to_representation(self, row):
+        return {
+            'id': row['id'],
+            'user': row['user'],
+            'delivery_crew': row['delivery_crew'],
+            'status': row['status'],
+            'total': decimal_string(row['total']),
+            'Date': row['date'].isoformat(),
+            'order_items': self.order_items.get(row['id'], []),
+        }
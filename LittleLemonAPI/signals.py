@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+from rest_framework.authtoken.models import Token
+
+from .authentication import forget_token, forget_user_tokens
+from .cache import bump_menu_version
+from .metrics import install_query_recorder
+from .models import Category, MenuItem
+from .roles import forget_group
+
+
+for model in (MenuItem, Category):
+    post_save.connect(bump_menu_version, sender=model, dispatch_uid=f'menu-cache-save-{model.__name__}')
+    post_delete.connect(bump_menu_version, sender=model, dispatch_uid=f'menu-cache-delete-{model.__name__}')
+
+def forget_deleted_token(sender, instance, **kwargs):
+    forget_token(instance.key)
+
+
+def forget_saved_user_tokens(sender, instance, created, **kwargs):
+    if not created:
+        forget_user_tokens(instance)
+
+
+# Keep CachedTokenAuthentication's cache in step with logouts and user changes
+post_delete.connect(forget_deleted_token, sender=Token, dispatch_uid='token-cache-delete')
+post_save.connect(forget_saved_user_tokens, sender=User, dispatch_uid='token-cache-user-save')
+
+post_save.connect(forget_group, sender=Group, dispatch_uid='group-id-save')
+post_delete.connect(forget_group, sender=Group, dispatch_uid='group-id-delete')
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    # For Django versions without the init_command option (settings.py leaves it out)
+    if connection.vendor != 'sqlite' or 'init_command' in connection.settings_dict['OPTIONS']:
+        return
+    with connection.cursor() as cursor:
+        for pragma in getattr(settings, 'SQLITE_PRAGMAS', []):
+            cursor.execute(f'PRAGMA {pragma}')
+
+
+connection_created.connect(apply_sqlite_pragmas, dispatch_uid='sqlite-pragmas')
+connection_created.connect(install_query_recorder, dispatch_uid='request-metrics-query-recorder')
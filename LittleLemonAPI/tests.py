@@ -1,3 +1,1392 @@
-from django.test import TestCase
+import base64
+import gzip
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
+from pathlib import Path
+from urllib.parse import urlencode
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+import django
+from django.contrib.auth.models import AnonymousUser, User, Group
+from django.core.cache import cache
+from django.core.management import call_command, CommandError
+from django.conf import settings
+from django.db import OperationalError, connection, connections, router
+from django.db.models import Count
+from django.http import HttpResponse
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import AsyncClient, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.renderers import JSONRenderer
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from . import archive, catalogue, dispatch, reporting
+from .cache import get_menu_version
+from .checks import check_shared_cache
+from .metrics import registry
+from .middleware import ReplicaRoutingMiddleware
+from .urls import api_patterns
+from .models import Category, MenuItem, Cart, Order, OrderItem, ArchivedOrder, ArchivedOrderItem, ThrottleCounter, DailySales, DailyMenuItemSales, DailyCrewOrders
+from .renderers import FastJSONRenderer
+from .routers import pin_key
+
+
+# Replicas configured through LITTLELEMON_DB_REPLICAS are left out; ReplicaRoutingTests opts in
+@override_settings(DATABASE_REPLICAS=[])
+class LittleLemonTestCase(APITestCase):
+    # The throttle counters have a database of their own on SQLite
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.managers = Group.objects.create(name='manager')
+        self.crew = Group.objects.create(name='delivery-crew')
+        self.category = Category.objects.create(slug='mains', title='Mains')
+
+    def create_user(self, username, group=None):
+        user = User.objects.create_user(username=username, password='lemon-pass-123')
+        if group:
+            group.user_set.add(user)
+        return user
+
+    def create_menu_items(self, count, prefix='Dish'):
+        return MenuItem.objects.bulk_create([
+            MenuItem(title=f'{prefix} {i}', price=Decimal('5.00') + i, featured=i % 2 == 0, category=self.category)
+            for i in range(count)
+        ])
+
+    def explain(self, sql):
+        # The query plan as a list of steps, on either database backend
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # Tiny test tables make a sequential scan the cheapest plan; ask for the index plan
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('EXPLAIN ' + sql)
+                return [row[0].strip().lstrip('-> ') for row in cursor.fetchall()]
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def full_scans(self, plan):
+        if connection.vendor == 'postgresql':
+            return [step for step in plan if step.startswith('Seq Scan')]
+        return [step for step in plan if step.startswith('SCAN') and 'USING' not in step]
+
+    def index_searches(self, plan):
+        if connection.vendor == 'postgresql':
+            return [step for step in plan if 'Index Scan' in step or 'Index Only Scan' in step]
+        return [step for step in plan if step.startswith('SEARCH')]
+
+    def sorts(self, plan):
+        if connection.vendor == 'postgresql':
+            return [step for step in plan if step.startswith(('Sort', 'Incremental Sort'))]
+        return [step for step in plan if 'TEMP B-TREE' in step]
+
+    def create_orders(self, user, count, items_per_order):
+        menu_items = self.create_menu_items(items_per_order, prefix=f'Order dish {Order.objects.count()}')
+        for _ in range(count):
+            order = Order.objects.create(user=user, status=False, total=Decimal('0.00'))
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, menuitem=item, quantity=1, unit_price=item.price, price=item.price)
+                for item in menu_items
+            ])
+
+
+class OrderQueryCountTests(LittleLemonTestCase):
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_order_listing_query_count_is_constant(self):
+        manager = self.create_user('manager', self.managers)
+        customer = self.create_user('customer')
+        self.client.force_authenticate(manager)
+
+        self.create_orders(customer, 1, 1)
+        baseline, _ = self.count_queries('/api/orders')
+
+        self.create_orders(customer, 20, 5)
+        grown, response = self.count_queries('/api/orders')
+
+        self.assertEqual(baseline, grown)
+        self.assertEqual(len(response.json()['results']), 21)
+
+    def test_order_detail_query_count_is_constant(self):
+        customer = self.create_user('customer')
+        self.client.force_authenticate(customer)
+
+        self.create_orders(customer, 1, 1)
+        small = Order.objects.latest('id')
+        baseline, _ = self.count_queries(f'/api/orders/{small.id}')
+
+        self.create_orders(customer, 1, 25)
+        large = Order.objects.latest('id')
+        grown, response = self.count_queries(f'/api/orders/{large.id}')
+
+        self.assertEqual(baseline, grown)
+        self.assertEqual(len(response.json()[0]['order_items']), 25)
+
+
+class CursorPaginationTests(LittleLemonTestCase):
+    def test_orders_are_paginated_by_cursor(self):
+        manager = self.create_user('manager', self.managers)
+        customer = self.create_user('customer')
+        self.client.force_authenticate(manager)
+        self.create_orders(customer, 7, 1)
+
+        seen = []
+        url = '/api/orders?page_size=3'
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            for query in queries:
+                self.assertNotIn('OFFSET', query['sql'])
+            seen += [order['id'] for order in response.json()['results']]
+            last_page, url = response.json(), response.json()['next']
+
+        self.assertEqual(seen, sorted(seen, reverse=True))
+        self.assertEqual(len(seen), 7)
+
+        response = self.client.get(last_page['previous'])
+        self.assertEqual([order['id'] for order in response.json()['results']], seen[3:6])
+
+    def test_tampered_cursors_are_rejected(self):
+        self.create_menu_items(3)
+        self.client.force_authenticate(self.create_user('customer'))
+        for position in (['abc', '1'], ['1.00', 'zz'], [None, None], [['1'], {}], ['1.00'], 'abc'):
+            cursor = base64.b64encode(urlencode({'p': json.dumps(position)}).encode()).decode()
+            response = self.client.get('/api/menu-items', {'page_size': 1, 'cursor': cursor})
+            self.assertEqual((response.status_code, response.json()), (404, {'detail': 'Invalid cursor'}))
+
+    def test_page_size_is_capped(self):
+        self.create_menu_items(120)
+        response = self.client.get('/api/menu-items?page_size=1000')
+        self.assertEqual(len(response.json()['results']), 100)
+        prices = [Decimal(item['price']) for item in response.json()['results']]
+        self.assertEqual(prices, sorted(prices))
+
+
+class MenuItemFilterPlanTests(LittleLemonTestCase):
+    # Every supported /menu-items query shape must be answered from an index.
+    query_shapes = [
+        '',
+        '?ordering=-price',
+        '?search=dish',
+        '?search=dish&ordering=-price',
+        '?category={category}',
+        '?category={category}&ordering=-price',
+        '?featured=true',
+        '?featured=false&ordering=-price',
+        '?min_price=6&max_price=9',
+        '?min_price=6',
+        '?max_price=9&ordering=-price',
+        '?category={category}&featured=true&min_price=6',
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.create_user('customer'))
+        self.create_menu_items(30)
+
+    def query_plans(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        for query in queries:
+            if query['sql'].startswith('SELECT'):
+                yield query['sql'], self.explain(query['sql'])
+
+    def test_query_shapes_use_indexes(self):
+        for shape in self.query_shapes:
+            url = '/api/menu-items' + shape.format(category=self.category.id)
+            with self.subTest(url=url):
+                for sql, plan in self.query_plans(url):
+                    self.assertEqual(self.full_scans(plan), [], f'Full table scan for {url}: {sql}')
+                    if ' WHERE ' in sql:
+                        self.assertTrue(self.index_searches(plan), f'Filter not served by an index for {url}: {plan}')
+
+    def test_filters(self):
+        other = Category.objects.create(slug='drinks', title='Drinks')
+        MenuItem.objects.create(title='Lemonade', price=Decimal('3.00'), featured=True, category=other)
+
+        def titles(query):
+            return [item['title'] for item in self.client.get('/api/menu-items' + query).json()['results']]
+
+        self.assertEqual(titles('?search=LEMON'), ['Lemonade'])
+        # Non-ASCII letters are folded the same way on both sides of the match
+        MenuItem.objects.create(title='Éclair', price=Decimal('4.00'), featured=False, category=self.category)
+        self.assertEqual(titles('?search=Éclair'), ['Éclair'])
+        self.assertEqual(titles('?search=ÉCLAIR'), ['Éclair'])
+        self.assertEqual(titles(f'?category={other.id}'), ['Lemonade'])
+        self.assertEqual(titles('?min_price=7&max_price=8'), ['Dish 2', 'Dish 3'])
+        self.assertEqual(titles('?ordering=-price&page_size=2'), ['Dish 29', 'Dish 28'])
+        self.assertNotIn('Dish 1', titles('?featured=true'))
+        self.assertEqual(self.client.get('/api/menu-items?min_price=abc').status_code, 400)
+
+
+class OrderIndexPlanTests(LittleLemonTestCase):
+    # Each role's /orders list query, on every page, must come from an index. Shapes
+    # not marked as allowed to sort must also read in index order, with no sort step.
+    query_shapes = [
+        ('customer', '', False),
+        ('customer', '?date_from=2020-01-01', False),
+        # Without table statistics the planner may prefer order_status_date_idx here
+        ('customer', '?status=false', True),
+        ('crew', '?status=false', False),
+        ('crew', '?status=false&date_from=2020-01-01', False),
+        ('crew', '?status=true&date_to=2099-12-31', False),
+        # Unfiltered, the crew's delivered and undelivered orders are merged by a sort
+        ('crew', '', True),
+        ('manager', '', False),
+        ('manager', '?status=false', False),
+        ('manager', '?status=true&date_from=2020-01-01&date_to=2099-12-31', False),
+        ('manager', '?date_to=2099-12-31', False),
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.users = {
+            'customer': self.create_user('customer'),
+            'crew': self.create_user('driver', self.crew),
+            'manager': self.create_user('manager', self.managers),
+        }
+        self.create_orders(self.users['customer'], 6, 1)
+        Order.objects.update(delivery_crew=self.users['crew'])
+
+    def order_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        for query in queries:
+            if query['sql'].startswith('SELECT') and ' FROM "LittleLemonAPI_order" ' in query['sql']:
+                yield query['sql']
+        if response.json()['next']:
+            yield from self.order_queries(response.json()['next'])
+
+    def test_role_queries_use_indexes(self):
+        for role, shape, may_sort in self.query_shapes:
+            self.client.force_authenticate(self.users[role])
+            url = '/api/orders?page_size=2' + shape.replace('?', '&')
+            with self.subTest(role=role, url=url):
+                sqls = list(self.order_queries(url))
+                self.assertTrue(sqls)
+                for sql in sqls:
+                    plan = self.explain(sql)
+                    self.assertEqual(self.full_scans(plan), [], f'Full table scan for {role} {url}: {plan}')
+                    self.assertTrue(self.index_searches(plan) or ' WHERE ' not in sql, f'Filter not served by an index for {role} {url}: {plan}')
+                    if not may_sort:
+                        self.assertEqual(self.sorts(plan), [], f'Sorted outside the index for {role} {url}: {plan}')
+
+    def test_filters(self):
+        customer = self.users['customer']
+        delivered = Order.objects.filter(user=customer).first()
+        Order.objects.filter(id=delivered.id).update(status=True, date='2020-01-15')
+        self.client.force_authenticate(customer)
+
+        def ids(query):
+            return [order['id'] for order in self.client.get('/api/orders' + query).json()['results']]
+
+        self.assertEqual(ids('?status=true'), [delivered.id])
+        self.assertNotIn(delivered.id, ids('?status=false'))
+        self.assertEqual(ids('?date_to=2020-01-31'), [delivered.id])
+        self.assertEqual(len(ids('?date_from=2020-02-01')), 5)
+        self.assertEqual(self.client.get('/api/orders?status=maybe').status_code, 400)
+
+
+class CompactSerializerTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = self.create_user('customer')
+        self.driver = self.create_user('driver', self.crew)
+        self.manager = self.create_user('manager', self.managers)
+        items = self.create_menu_items(6)
+        MenuItem.objects.filter(id=items[0].id).update(price=Decimal('0.10'), title='Crème brûlée "special"')
+        MenuItem.objects.filter(id=items[1].id).update(price=Decimal('1234.50'))
+        self.create_orders(self.customer, 4, 3)
+        Order.objects.filter(id__in=Order.objects.values('id')[:2]).update(delivery_crew=self.driver, status=True, total=Decimal('17.05'))
+        Order.objects.create(user=self.customer, status=False, total=Decimal('0.00'))
+
+    def pages(self, user, url):
+        self.client.force_authenticate(user)
+        while url:
+            cache.clear()
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            yield response.content
+            url = response.json()['next']
+
+    def test_output_is_byte_identical(self):
+        cases = [
+            (self.customer, '/api/menu-items?page_size=4'),
+            (self.customer, '/api/menu-items?ordering=-price&search=dish'),
+            (self.customer, f'/api/menu-items?category={self.category.id}&featured=true'),
+            (self.customer, '/api/orders?page_size=2'),
+            (self.driver, '/api/orders'),
+            (self.manager, '/api/orders?page_size=3'),
+            (self.manager, '/api/orders?status=false'),
+        ]
+        for user, url in cases:
+            with self.subTest(user=user.username, url=url):
+                with override_settings(COMPACT_SERIALIZERS=False):
+                    expected = list(self.pages(user, url))
+                actual = list(self.pages(user, url))
+                self.assertEqual(actual, expected)
+
+
+class RendererTests(LittleLemonTestCase):
+    def test_output_matches_drf_json_renderer(self):
+        data = {
+            'results': [{'title': 'Crème brûlée', 'price': '6.50', 'featured': True, 'category': None}],
+            'when': datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc),
+            'day': date(2024, 5, 1),
+            'note': 'line\u2028separator\u2029',
+            'error': ErrorDetail('Not found.', code='not_found'),
+            'lazy': gettext_lazy('This field is required.'),
+            1: [1.5, 2, None],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_decimals_are_written_as_strings(self):
+        self.assertEqual(FastJSONRenderer().render({'price': Decimal('0.10')}), b'{"price":"0.10"}')
+
+    def test_indent_is_honoured(self):
+        self.assertEqual(FastJSONRenderer().render({'a': 1}, 'application/json; indent=2'), b'{\n  "a": 1\n}')
+
+    def test_large_responses_are_compressed(self):
+        manager = self.create_user('manager', self.managers)
+        self.create_orders(self.create_user('customer'), 10, 3)
+        self.client.force_authenticate(manager)
+
+        plain = self.client.get('/api/orders')
+        compressed = self.client.get('/api/orders', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertLess(len(compressed.content), len(plain.content))
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+
+        small = self.client.get('/api/orders?page_size=1&status=true', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertLess(len(small.content), 1024)
+        self.assertNotIn('Content-Encoding', small)
+
+
+class TokenCacheTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        # A file cache stands in for a shared backend; the LocMem default is process-local
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        tokens = override_settings(TOKEN_CACHE='tokens', CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'tokens': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory.name},
+        })
+        tokens.enable()
+        self.addCleanup(tokens.disable)
+        self.user = self.create_user('customer')
+        self.token = Token.objects.create(user=self.user)
+
+    def get(self, token=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/orders', HTTP_AUTHORIZATION=f'Token {token or self.token.key}')
+        return response, len([query for query in queries if 'authtoken_token' in query['sql']])
+
+    def test_token_lookups_are_cached(self):
+        response, lookups = self.get()
+        self.assertEqual((response.status_code, lookups), (200, 1))
+        response, lookups = self.get()
+        self.assertEqual((response.status_code, lookups), (200, 0))
+        self.assertEqual(response.wsgi_request.user, self.user)
+
+    def test_process_local_caches_are_not_used(self):
+        with override_settings(TOKEN_CACHE='default'):
+            self.assertEqual([self.get()[1], self.get()[1]], [1, 1])
+            self.user.is_active = False
+            self.user.save()
+            self.assertEqual(self.get()[0].status_code, 401)
+
+    def test_invalid_tokens_are_rejected(self):
+        self.assertEqual(self.get(token='not-a-token')[0].status_code, 401)
+
+    def test_logout_invalidates_the_token(self):
+        self.get()
+        response = self.client.post('/token/logout/', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get()[0].status_code, 401)
+
+    def test_deactivation_invalidates_the_token(self):
+        self.get()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get()[0].status_code, 401)
+
+    def test_session_authentication_still_works(self):
+        self.client.login(username='customer', password='lemon-pass-123')
+        self.assertEqual(self.client.get('/api/orders').status_code, 200)
+
+
+class MenuCacheTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        self.manager = self.create_user('manager', self.managers)
+        self.client.force_authenticate(self.manager)
+        self.item = MenuItem.objects.create(title='Pasta', price=Decimal('9.50'), featured=False, category=self.category)
+
+    def test_deploy_check_requires_a_shared_cache(self):
+        self.assertEqual([error.id for error in check_shared_cache(None)], ['LittleLemonAPI.E001'])
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}}):
+                self.assertEqual(check_shared_cache(None), [])
+
+    def test_repeated_reads_are_served_from_cache(self):
+        first = self.client.get('/api/menu-items')
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get('/api/menu-items')
+        self.assertEqual(first.json(), second.json())
+        self.assertFalse([q for q in queries if 'LittleLemonAPI_menuitem' in q['sql']])
+
+    def test_writes_invalidate_cache(self):
+        self.client.get(f'/api/menu-items/{self.item.id}')
+        self.client.get('/api/menu-items')
+
+        response = self.client.put(f'/api/menu-items/{self.item.id}', {'title': 'Lasagna', 'price': '11.00', 'featured': True, 'category': self.category.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(f'/api/menu-items/{self.item.id}').json()['title'], 'Lasagna')
+
+        self.category.title = 'Pastas'
+        self.category.save()
+        self.client.delete(f'/api/menu-items/{self.item.id}')
+        self.assertEqual(self.client.get('/api/menu-items').json()['results'], [])
+
+    def test_etag_returns_not_modified(self):
+        etag = self.client.get('/api/menu-items?featured=false')['ETag']
+        response = self.client.get('/api/menu-items?featured=false', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        MenuItem.objects.create(title='Soup', price=Decimal('4.00'), featured=False, category=self.category)
+        response = self.client.get('/api/menu-items?featured=false', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class RoleResolutionTests(LittleLemonTestCase):
+    def group_queries(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data, format='json')
+        return response, [q for q in queries if 'FROM "auth_group"' in q['sql']]
+
+    def test_roles_are_resolved_once_per_request(self):
+        customer = self.create_user('customer')
+        driver = self.create_user('driver', self.crew)
+        manager = self.create_user('manager', self.managers)
+        self.create_orders(customer, 1, 2)
+        order = Order.objects.get()
+        order.delivery_crew = driver
+        order.save()
+
+        self.client.force_authenticate(driver)
+        response, queries = self.group_queries('patch', f'/api/orders/{order.id}', {'status': True})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+
+        response, queries = self.group_queries('get', f'/api/orders/{order.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+
+        self.client.force_authenticate(manager)
+        response, queries = self.group_queries('get', '/api/groups/delivery-crew/users')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+
+    def test_order_detail_visibility(self):
+        customer = self.create_user('customer')
+        stranger = self.create_user('stranger')
+        self.create_orders(customer, 1, 1)
+        order = Order.objects.get()
+
+        self.client.force_authenticate(customer)
+        self.assertEqual(self.client.get(f'/api/orders/{order.id}').json()[0]['id'], order.id)
+        self.assertEqual(self.client.get(f'/api/orders/{order.id + 1}').status_code, 404)
+
+        self.client.force_authenticate(stranger)
+        self.assertEqual(self.client.get(f'/api/orders/{order.id}').status_code, 403)
+
+
+class CheckoutTests(LittleLemonTestCase):
+    def fill_cart(self, user, menu_items):
+        Cart.objects.bulk_create([
+            Cart(user=user, menuitem=item, quantity=2, unit_price=item.price, price=item.price * 2)
+            for item in menu_items
+        ])
+
+    def checkout(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/orders')
+        return response, len(queries)
+
+    def test_checkout_moves_cart_into_order(self):
+        customer = self.create_user('customer')
+        self.client.force_authenticate(customer)
+        menu = self.create_menu_items(3)
+        self.fill_cart(customer, menu)
+
+        response, _ = self.checkout()
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get()
+        self.assertEqual(order.total, sum(item.price * 2 for item in menu))
+        self.assertEqual(order.orderitem_set.count(), 3)
+        self.assertFalse(Cart.objects.exists())
+
+        response, _ = self.checkout()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_checkout_query_count_is_constant(self):
+        customer = self.create_user('customer')
+        self.client.force_authenticate(customer)
+        menu = self.create_menu_items(40)
+
+        self.fill_cart(customer, menu[:1])
+        _, small = self.checkout()
+        self.fill_cart(customer, menu)
+        _, large = self.checkout()
+        self.assertEqual(small, large)
+
+
+class CartBatchTests(LittleLemonTestCase):
+    def test_batch_upserts_cart_lines(self):
+        customer = self.create_user('customer')
+        self.client.force_authenticate(customer)
+        menu = self.create_menu_items(20)
+        self.client.post('/api/cart/menu-items', {'menuitem': menu[0].id, 'quantity': 1}, format='json')
+
+        lines = [{'menuitem': item.id, 'quantity': 3} for item in menu]
+        lines += [{'menuitem': 99999, 'quantity': 1}, {'menuitem': menu[1].id, 'quantity': 0}]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/cart/menu-items', lines, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(queries), 5)
+
+        statuses = [result['status'] for result in response.json()['results']]
+        self.assertEqual(statuses, ['updated'] + ['added'] * 19 + ['invalid', 'invalid'])
+        cart = Cart.objects.filter(user=customer)
+        self.assertEqual(cart.count(), 20)
+        self.assertEqual({line.quantity for line in cart}, {3})
+        self.assertEqual(cart.get(menuitem=menu[4]).price, menu[4].price * 3)
+
+    def test_single_item_duplicate_is_a_conflict(self):
+        customer = self.create_user('customer')
+        self.client.force_authenticate(customer)
+        item = self.create_menu_items(1)[0]
+        data = {'menuitem': item.id, 'quantity': 1}
+        self.assertEqual(self.client.post('/api/cart/menu-items', data, format='json').status_code, 201)
+        self.assertEqual(self.client.post('/api/cart/menu-items', data, format='json').status_code, 409)
+
+
+THROTTLE_WORKER = """
+import sys
+from types import SimpleNamespace
+import django
+from django.conf import settings
+alias = settings.THROTTLE_DATABASE or 'default'
+settings.DATABASES[alias]['NAME'] = sys.argv[1]
+django.setup()
+if sys.argv[2] == 'migrate':
+    from django.core.management import call_command, CommandError
+    call_command('migrate', database=alias, verbosity=0)
+else:
+    from LittleLemonAPI.throttling import SharedUserRateThrottle
+    class Throttle(SharedUserRateThrottle):
+        rate = '60/hour'
+    request = SimpleNamespace(user=SimpleNamespace(is_authenticated=True, pk=sys.argv[3]), META={})
+    print(sum(Throttle().allow_request(request, None) for _ in range(int(sys.argv[2]))))
+"""
+
+
+class SharedThrottleTests(LittleLemonTestCase):
+    def run_worker(self, database, *arguments):
+        return subprocess.Popen(
+            [sys.executable, '-c', THROTTLE_WORKER, database, *arguments],
+            cwd=Path(__file__).resolve().parent.parent,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'LittleLemon.settings'},
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+
+    def test_limit_is_enforced_across_processes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            if connection.vendor == 'sqlite':
+                # The test database is in memory, so the workers share a file of their own
+                database = os.path.join(directory, 'throttle.sqlite3')
+                self.assertEqual(self.run_worker(database, 'migrate').wait(), 0)
+            else:
+                database = connections[router.db_for_write(ThrottleCounter)].settings_dict['NAME']
+
+            workers = [self.run_worker(database, '40', str(os.getpid())) for _ in range(4)]
+            allowed = [int(worker.communicate()[0]) for worker in workers]
+
+        self.assertEqual(sum(allowed), 60)
+
+    def test_requests_over_the_limit_are_rejected(self):
+        self.create_menu_items(1)
+        statuses = [self.client.get('/api/menu-items?page_size=%d' % i).status_code for i in range(1, 4)]
+        self.assertEqual(statuses, [200, 200, 429])
+
+    def test_counters_stay_off_the_main_database(self):
+        self.create_menu_items(1)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/api/menu-items').status_code, 200)
+        self.assertEqual(router.db_for_write(ThrottleCounter), settings.THROTTLE_DATABASE or 'default')
+        if settings.THROTTLE_DATABASE:
+            self.assertFalse([query for query in queries if 'throttlecounter' in query['sql']])
+            self.assertTrue(ThrottleCounter.objects.using(settings.THROTTLE_DATABASE).exists())
+
+    def test_unwritable_counters_let_requests_through(self):
+        self.create_menu_items(1)
+        with mock.patch('LittleLemonAPI.throttling._hit_database', side_effect=OperationalError('database is locked')):
+            with self.assertLogs('LittleLemonAPI.throttling', 'WARNING'):
+                statuses = [self.client.get('/api/menu-items').status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 200])
+
+
+class OrderExportTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        self.manager = self.create_user('manager', self.managers)
+        self.customer = self.create_user('customer')
+        self.create_orders(self.customer, 5, 2)
+        Order.objects.filter(id__in=Order.objects.order_by('id').values('id')[:2]).update(status=True)
+
+    def export(self, query=''):
+        response = self.client.get('/api/orders/export' + query)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_export(self):
+        self.client.force_authenticate(self.manager)
+        lines = [json.loads(line) for line in self.export().splitlines()]
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(len(lines[0]['order_items']), 2)
+        self.assertEqual(lines[0]['total'], '0.00')
+
+        lines = self.export('?status=false&date_from=2000-01-01').splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(self.export('?date_to=2000-01-01'), '')
+
+    def test_csv_export(self):
+        self.client.force_authenticate(self.manager)
+        rows = self.export('?output=csv&status=true').splitlines()
+        self.assertEqual(rows[0].split(',')[:3], ['order_id', 'user', 'delivery_crew'])
+        self.assertEqual(len(rows), 1 + 2 * 2)
+
+    def test_export_is_manager_only(self):
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.client.get('/api/orders/export').status_code, 403)
+
+
+class OrderConcurrencyTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = self.create_user('customer')
+        self.manager = self.create_user('manager', self.managers)
+        self.driver = self.create_user('driver', self.crew)
+        self.other_driver = self.create_user('other-driver', self.crew)
+        self.create_orders(self.customer, 1, 2)
+        self.order = Order.objects.get()
+        Order.objects.filter(pk=self.order.pk).update(delivery_crew=self.driver)
+        self.url = f'/api/orders/{self.order.pk}'
+
+    def etag(self, version):
+        return f'"{self.order.pk}.{version}"'
+
+    def deliver(self, **headers):
+        self.client.force_authenticate(self.driver)
+        return self.client.patch(self.url, {'status': True}, format='json', **headers)
+
+    def assign(self, driver, **headers):
+        self.client.force_authenticate(self.manager)
+        return self.client.patch(self.url, {'user': self.customer.pk, 'delivery_crew': driver.pk}, format='json', **headers)
+
+    def test_get_sends_the_version_as_etag(self):
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.client.get(self.url)['ETag'], self.etag(1))
+
+    def test_stale_if_match_is_rejected(self):
+        response = self.deliver(HTTP_IF_MATCH=self.etag(1))
+        self.assertEqual((response.status_code, response['ETag']), (200, self.etag(2)))
+
+        response = self.assign(self.other_driver, HTTP_IF_MATCH=self.etag(1))
+        self.assertEqual((response.status_code, response['ETag']), (412, self.etag(2)))
+        self.assertEqual(Order.objects.get().delivery_crew_id, self.driver.pk)
+
+        response = self.assign(self.other_driver, HTTP_IF_MATCH=f'W/{self.etag(2)}')
+        self.assertEqual((response.status_code, response['ETag']), (201, self.etag(3)))
+        self.assertEqual(self.assign(self.driver, HTTP_IF_MATCH='"999.3"').status_code, 412)
+
+    def test_updates_touch_only_their_own_fields(self):
+        # The manager's assignment, made without having seen the delivery, must not undo it
+        self.assertEqual(self.deliver().status_code, 200)
+        self.assertEqual(self.assign(self.other_driver).status_code, 201)
+        order = Order.objects.get()
+        self.assertEqual((order.status, order.delivery_crew_id, order.version), (True, self.other_driver.pk, 3))
+
+    def test_crew_update_is_a_single_conditional_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.deliver(HTTP_IF_MATCH=self.etag(1)).status_code, 200)
+        order_queries = [query['sql'] for query in queries if 'LittleLemonAPI_order' in query['sql']]
+        self.assertEqual(len(order_queries), 1)
+        self.assertTrue(order_queries[0].startswith('UPDATE'))
+        self.assertNotIn('"delivery_crew_id" =', order_queries[0].split('WHERE')[0])
+
+    def test_crew_errors(self):
+        self.client.force_authenticate(self.other_driver)
+        self.assertEqual(self.client.patch(self.url, {'status': True}, format='json').status_code, 403)
+        self.assertEqual(self.client.patch('/api/orders/999', {'status': True}, format='json').status_code, 404)
+        self.client.force_authenticate(self.driver)
+        self.assertEqual(self.client.patch(self.url, {'status': 'maybe'}, format='json').status_code, 400)
+
+
+class MenuImportTests(LittleLemonTestCase):
+    CSV = (
+        'title,price,featured,category,category_title\n'
+        'Soup,4.50,true,mains,Mains\n'
+        'Salad,6.00,false,starters,Starters\n'
+        'Cake,5.00,,desserts,\n'
+        'Broken,abc,false,mains,\n'
+        'Bad category,3.00,false,not a slug,\n'
+        'Steak,25.00,yes,mains,\n'
+    )
+
+    def upload(self, content, user=None):
+        self.client.force_authenticate(user or self.create_user('manager', self.managers))
+        return self.client.post('/api/menu-items/import', {'file': SimpleUploadedFile('menu.csv', content.encode())}, format='multipart')
+
+    def test_items_are_created_updated_and_left_unchanged(self):
+        MenuItem.objects.create(title='Soup', price=Decimal('4.50'), featured=True, category=self.category)
+        MenuItem.objects.create(title='Steak', price=Decimal('20.00'), featured=True, category=self.category)
+        # Same title in another category is a different item
+        MenuItem.objects.create(title='Salad', price=Decimal('6.00'), featured=False, category=self.category)
+        response = self.upload(self.CSV)
+
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual({key: result[key] for key in ('created', 'updated', 'unchanged', 'invalid')}, {'created': 2, 'updated': 1, 'unchanged': 1, 'invalid': 2})
+        self.assertEqual([error['line'] for error in result['errors']], [5, 6])
+        self.assertEqual(MenuItem.objects.get(title='Steak').price, Decimal('25.00'))
+        self.assertEqual(dict(Category.objects.values_list('slug', 'title')), {'mains': 'Mains', 'starters': 'Starters', 'desserts': 'desserts'})
+        self.assertFalse(MenuItem.objects.get(title='Cake').featured)
+
+    def test_files_without_featured_keep_the_flag(self):
+        MenuItem.objects.create(title='Steak', price=Decimal('20.00'), featured=True, category=self.category)
+        MenuItem.objects.create(title='Soup', price=Decimal('4.50'), featured=True, category=self.category)
+        result = self.upload('title,price,category\nSteak,21.00,mains\nSoup,4.50,mains\nCake,5.00,mains\n').json()
+        self.assertEqual({key: result[key] for key in ('created', 'updated', 'unchanged')}, {'created': 1, 'updated': 1, 'unchanged': 1})
+        self.assertEqual(dict(MenuItem.objects.values_list('title', 'featured')), {'Steak': True, 'Soup': True, 'Cake': False})
+        self.assertEqual(MenuItem.objects.get(title='Steak').price, Decimal('21.00'))
+
+    def test_import_invalidates_the_menu_cache(self):
+        self.assertEqual(self.client.get('/api/menu-items').json()['results'], [])
+        self.upload(self.CSV)
+        self.client.force_authenticate(None)
+        self.assertEqual(len(self.client.get('/api/menu-items').json()['results']), 4)
+
+    def test_batches_take_a_fixed_number_of_queries(self):
+        counts = []
+        for rows in (10, 40):
+            content = 'title,price,category\n' + ''.join(f'Dish {rows} {i},{i}.00,mains\n' for i in range(rows))
+            with CaptureQueriesContext(connection) as queries:
+                result = catalogue.import_menu(content.splitlines(keepends=True), batch_size=10)
+            self.assertEqual(result.created, rows)
+            counts.append(len(queries))
+        # The category is resolved once; each batch then looks up and writes its items
+        # in a transaction of its own (a savepoint and its release here)
+        self.assertEqual(counts[1] - counts[0], 3 * (2 + 2))
+
+    def test_batches_are_kept_when_a_later_one_fails(self):
+        def lines():
+            yield 'title,price,category\n'
+            for i in range(3):
+                yield f'Dish {i},{i}.00,mains\n'
+            raise UnicodeDecodeError('utf-8', b'\xff', 0, 1, 'invalid start byte')
+
+        version = get_menu_version()
+        with self.assertRaises(UnicodeDecodeError):
+            catalogue.import_menu(lines(), batch_size=2)
+        self.assertEqual(list(MenuItem.objects.order_by('title').values_list('title', flat=True)), ['Dish 0', 'Dish 1'])
+        self.assertGreater(get_menu_version(), version)
+
+    def test_command_and_rejected_uploads(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as csv_file:
+            csv_file.write(self.CSV)
+        self.addCleanup(os.remove, csv_file.name)
+        out = StringIO()
+        call_command('import_menu', csv_file.name, stdout=out, stderr=StringIO())
+        self.assertIn('4 created, 0 updated, 0 unchanged, 2 invalid', out.getvalue())
+
+        self.assertEqual(self.upload('name,price\nSoup,4.00\n').status_code, 400)
+        self.assertEqual(self.upload(self.CSV, self.create_user('customer')).status_code, 403)
+        with self.assertRaises(CommandError):
+            call_command('import_menu', csv_file.name + '.missing')
+
+
+class GroupMembersTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        self.manager = self.create_user('manager', self.managers)
+        self.client.force_authenticate(self.manager)
+
+    def send(self, method, data):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)('/api/groups/delivery-crew/users', data, format='json')
+        return response, queries
+
+    def test_a_shift_of_drivers_is_added_with_a_fixed_number_of_queries(self):
+        drivers = User.objects.bulk_create([User(username=f'driver{i}') for i in range(50)])
+        counts, group_lookups = [], []
+        for batch in (drivers[:5], drivers[5:]):
+            response, queries = self.send('post', {'usernames': [driver.username for driver in batch]})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual({result['result'] for result in response.json()['results']}, {'added'})
+            counts.append(len(queries))
+            group_lookups.append(len([query for query in queries if 'FROM "auth_group" WHERE' in query['sql']]))
+        # Only the first request looks the group up by name
+        self.assertEqual(group_lookups, [1, 0])
+        self.assertEqual(counts[0], counts[1] + 1)
+        self.assertEqual(self.crew.user_set.count(), 50)
+
+    def test_results_per_user(self):
+        drivers = [self.create_user(f'driver{i}', self.crew if i == 0 else None) for i in range(3)]
+        response, _ = self.send('post', {'usernames': ['driver0', 'driver1', 'nobody'], 'ids': [drivers[2].pk, 999999]})
+        self.assertEqual([(result.get('username'), result.get('id'), result['result']) for result in response.json()['results']], [
+            ('driver0', drivers[0].pk, 'already_member'), ('driver1', drivers[1].pk, 'added'), ('nobody', None, 'not_found'),
+            ('driver2', drivers[2].pk, 'added'), (None, 999999, 'not_found'),
+        ])
+
+        response, queries = self.send('delete', {'ids': [drivers[0].pk, drivers[1].pk, self.manager.pk]})
+        self.assertEqual([result['result'] for result in response.json()['results']], ['removed', 'removed', 'not_member'])
+        self.assertEqual(list(self.crew.user_set.values_list('username', flat=True)), ['driver2'])
+        self.assertTrue(self.managers.user_set.filter(pk=self.manager.pk).exists())
+
+    def test_single_username_and_bad_payloads(self):
+        self.create_user('driver')
+        response = self.client.post('/api/groups/manager/users', {'username': 'driver'}, format='json')
+        self.assertEqual((response.status_code, response.json()['message']), (201, 'User added to Manager Group.'))
+        self.assertEqual(self.client.post('/api/groups/manager/users', {'username': 'nobody'}, format='json').status_code, 404)
+        self.assertEqual(self.send('post', {'usernames': []})[0].status_code, 400)
+        self.assertEqual(self.send('post', {'ids': ['x']})[0].status_code, 400)
+
+    def test_group_id_is_cached_until_the_group_changes(self):
+        driver = self.create_user('driver')
+        self.client.post('/api/groups/delivery-crew/users', {'username': 'driver'}, format='json')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.delete(f'/api/groups/delivery-crew/users/{driver.pk}')
+        self.assertFalse([query for query in queries if 'FROM "auth_group" WHERE' in query['sql']])
+
+        self.crew.delete()
+        self.send('post', {'usernames': ['driver']})
+        self.assertEqual(list(Group.objects.get(name='delivery-crew').user_set.all()), [driver])
+
+
+class OrderBulkTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = self.create_user('customer')
+        self.manager = self.create_user('manager', self.managers)
+        self.drivers = [self.create_user(f'driver{i}', self.crew) for i in range(3)]
+
+    def orders(self, count):
+        self.create_orders(self.customer, count, 1)
+        return list(Order.objects.order_by('id').values_list('id', flat=True))[-count:]
+
+    def post(self, user, operations):
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/orders/bulk', operations, format='json')
+        return response, queries
+
+    def test_assignments_take_a_fixed_number_of_queries(self):
+        counts = []
+        for size in (3, 30):
+            ids = self.orders(size)
+            operations = [{'order_id': pk, 'delivery_crew': self.drivers[i % 3].pk} for i, pk in enumerate(ids)]
+            response, queries = self.post(self.manager, operations)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual({result['result'] for result in response.json()['results']}, {'updated'})
+            self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE')]), 1)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(Order.objects.filter(delivery_crew=self.drivers[1]).count(), 11)
+        self.assertEqual(sum(DailyCrewOrders.objects.values_list('orders', flat=True)), 33)
+
+    def test_results_per_operation(self):
+        ids = self.orders(5)
+        Order.objects.filter(pk=ids[3]).update(version=4)
+        response, _ = self.post(self.manager, [
+            {'order_id': ids[0], 'delivery_crew': self.drivers[0].pk},
+            {'order_id': ids[1], 'delivery_crew': self.customer.pk},
+            {'order_id': 999999, 'delivery_crew': self.drivers[0].pk},
+            {'order_id': ids[2], 'status': True},
+            {'order_id': ids[3], 'delivery_crew': self.drivers[0].pk, 'version': 3},
+            {'order_id': ids[0], 'delivery_crew': self.drivers[1].pk},
+            {'order_id': ids[4], 'delivery_crew': self.drivers[2].pk, 'version': 1},
+        ])
+        self.assertEqual([(result['order_id'], result['result']) for result in response.json()['results']], [
+            (ids[0], 'updated'), (ids[1], 'invalid'), (999999, 'not_found'), (ids[2], 'forbidden'),
+            (ids[3], 'precondition_failed'), (ids[0], 'invalid'), (ids[4], 'updated'),
+        ])
+        self.assertEqual(response.json()['results'][6]['version'], 2)
+        self.assertEqual(dict(Order.objects.filter(pk__in=ids).values_list('id', 'delivery_crew_id')),
+                         {ids[0]: self.drivers[0].pk, ids[1]: None, ids[2]: None, ids[3]: None, ids[4]: self.drivers[2].pk})
+
+    def test_crew_mark_their_own_orders(self):
+        ids = self.orders(4)
+        Order.objects.filter(pk__in=ids[:3]).update(delivery_crew=self.drivers[0])
+        Order.objects.filter(pk=ids[2]).update(status=True)
+        response, queries = self.post(self.drivers[0], [
+            {'order_id': ids[0], 'status': True},
+            {'order_id': ids[1], 'status': True},
+            {'order_id': ids[2], 'status': False},
+            {'order_id': ids[3], 'status': True},
+            {'order_id': ids[1], 'delivery_crew': self.drivers[0].pk},
+        ])
+        self.assertEqual([result['result'] for result in response.json()['results']], ['updated', 'updated', 'updated', 'forbidden', 'invalid'])
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE')]), 1)
+        self.assertEqual(dict(Order.objects.filter(pk__in=ids).values_list('id', 'status')),
+                         {ids[0]: True, ids[1]: True, ids[2]: False, ids[3]: False})
+
+    def test_customers_and_bad_payloads_are_rejected(self):
+        ids = self.orders(1)
+        self.assertEqual(self.post(self.customer, [{'order_id': ids[0], 'status': True}])[0].status_code, 403)
+        self.assertEqual(self.post(self.manager, {'order_id': ids[0]})[0].status_code, 400)
+        self.assertEqual(self.post(self.manager, [{'order_id': ids[0], 'status': True, 'delivery_crew': 1}])[0].status_code, 400)
+
+
+class DispatchTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = self.create_user('customer')
+        self.drivers = [self.create_user(f'driver{i}', self.crew) for i in range(3)]
+
+    def open_orders(self):
+        return dict(Order.objects.filter(status=False, delivery_crew__isnull=False).values('delivery_crew').annotate(open=Count('id')).values_list('delivery_crew', 'open'))
+
+    def test_orders_go_to_the_least_loaded_crew(self):
+        self.create_orders(self.customer, 4, 1)
+        existing = list(Order.objects.values_list('id', flat=True))
+        Order.objects.filter(pk__in=existing[:3]).update(delivery_crew=self.drivers[0])
+        Order.objects.filter(pk=existing[3]).update(delivery_crew=self.drivers[1])
+        # Delivered orders don't count towards the load
+        Order.objects.filter(pk__in=existing[:2]).update(status=True)
+        inactive = self.create_user('inactive', self.crew)
+        User.objects.filter(pk=inactive.pk).update(is_active=False)
+        self.create_orders(self.customer, 7, 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(dispatch.dispatch(batch_size=3), 7)
+        self.assertEqual(self.open_orders(), {self.drivers[0].pk: 3, self.drivers[1].pk: 3, self.drivers[2].pk: 3})
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE')]), 3)
+        self.assertEqual(set(Order.objects.exclude(pk__in=existing).values_list('version', flat=True)), {2})
+        self.assertEqual(sum(DailyCrewOrders.objects.values_list('orders', flat=True)), 7)
+        self.assertEqual(dispatch.dispatch(), 0)
+
+    def test_without_crew_nothing_is_assigned(self):
+        self.crew.user_set.clear()
+        self.create_orders(self.customer, 2, 1)
+        self.assertEqual(dispatch.dispatch(), 0)
+        self.assertFalse(Order.objects.filter(delivery_crew__isnull=False).exists())
+
+    def test_checkout_dispatches_when_enabled(self):
+        Order.objects.create(user=self.customer, status=False, total=Decimal('0.00'))
+        item = self.create_menu_items(1)[0]
+        self.client.force_authenticate(self.customer)
+        for enabled in (False, True):
+            Cart.objects.create(user=self.customer, menuitem=item, quantity=1, unit_price=item.price, price=item.price)
+            with override_settings(DISPATCH_ON_CHECKOUT=enabled):
+                self.assertEqual(self.client.post('/api/orders').status_code, 201)
+            self.assertEqual(Order.objects.latest('id').delivery_crew_id, self.drivers[0].pk if enabled else None)
+        # Only the new order is dispatched at checkout; the command picks up the rest
+        self.assertEqual(Order.objects.filter(delivery_crew__isnull=True).count(), 2)
+        call_command('dispatch_orders', stdout=open(os.devnull, 'w'))
+        self.assertEqual(self.open_orders(), {self.drivers[0].pk: 1, self.drivers[1].pk: 1, self.drivers[2].pk: 1})
+
+
+class ArchiveTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        self.manager = self.create_user('manager', self.managers)
+        self.customer = self.create_user('customer')
+        self.driver = self.create_user('driver', self.crew)
+        self.create_orders(self.customer, 6, 2)
+        ids = list(Order.objects.order_by('id').values_list('id', flat=True))
+        # Five old orders, four of them delivered, and a recent delivered one
+        Order.objects.filter(pk__in=ids[:5]).update(date=date(2020, 1, 1), delivery_crew=self.driver)
+        Order.objects.filter(pk__in=ids[:4] + ids[5:]).update(status=True)
+        self.old, self.undelivered, self.recent = ids[:4], ids[4], ids[5]
+
+    def rollups(self):
+        reporting.rebuild()
+        return [list(model.objects.order_by(*keys).values(*keys, *values)) for model, keys, values in (
+            (DailySales, ['date'], ['orders', 'revenue']),
+            (DailyMenuItemSales, ['date', 'menuitem'], ['quantity', 'revenue']),
+            (DailyCrewOrders, ['date', 'delivery_crew'], ['orders']),
+        )]
+
+    def test_old_delivered_orders_move_in_batches(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(archive.archive_orders(batch_size=3, limit=3), 3)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('INSERT')]), 2)
+        # Resumes where the last run stopped
+        self.assertEqual(archive.archive_orders(batch_size=3), 1)
+        self.assertEqual(archive.archive_orders(), 0)
+
+        self.assertEqual(sorted(ArchivedOrder.objects.values_list('id', flat=True)), self.old)
+        self.assertEqual(ArchivedOrderItem.objects.filter(order__in=self.old).count(), 8)
+        self.assertEqual(sorted(Order.objects.values_list('id', flat=True)), [self.undelivered, self.recent])
+        self.assertFalse(OrderItem.objects.filter(order__in=self.old).exists())
+
+    def test_archived_orders_are_read_through_the_same_views(self):
+        self.client.force_authenticate(self.customer)
+        before = self.client.get(f'/api/orders/{self.old[0]}')
+        self.client.force_authenticate(self.manager)
+        export = self.client.get('/api/orders/export')
+        export = b''.join(export.streaming_content)
+        call_command('archive_orders', stdout=open(os.devnull, 'w'))
+
+        for async_reads in (False, True):
+            with override_settings(ROOT_URLCONF=AsyncURLConf if async_reads else 'LittleLemon.urls'):
+                self.client.force_authenticate(self.customer)
+                after = self.client.get(f'/api/orders/{self.old[0]}')
+            self.assertEqual((after.status_code, after.content, after['ETag']), (200, before.content, before['ETag']))
+        self.client.force_authenticate(self.create_user('stranger'))
+        self.assertEqual(self.client.get(f'/api/orders/{self.old[0]}').status_code, 403)
+
+        self.client.force_authenticate(self.manager)
+        self.assertEqual(b''.join(self.client.get('/api/orders/export').streaming_content), export)
+        self.assertEqual(self.client.patch(f'/api/orders/{self.old[0]}', {'user': self.customer.pk, 'delivery_crew': self.driver.pk}, format='json').status_code, 404)
+
+    def test_archived_and_missing_orders_cannot_be_deleted(self):
+        archive.archive_orders()
+        self.client.force_authenticate(self.manager)
+        for order_id in (self.old[0], self.recent + 100):
+            response = self.client.delete(f'/api/orders/{order_id}')
+            self.assertEqual((response.status_code, response.json()), (404, {'message': 'Order not found.'}))
+        self.assertTrue(ArchivedOrder.objects.filter(pk=self.old[0]).exists())
+
+    def test_batches_are_read_in_index_order(self):
+        with CaptureQueriesContext(connection) as queries:
+            archive.archive_orders()
+        batch = next(query['sql'] for query in queries if query['sql'].startswith('SELECT') and 'status' in query['sql'])
+        plan = self.explain(batch)
+        self.assertEqual((self.full_scans(plan), self.sorts(plan)), ([], []))
+
+    def test_rollups_rebuild_the_same_after_archiving(self):
+        before = self.rollups()
+        archive.archive_orders()
+        self.assertEqual(self.rollups(), before)
+
+
+class SalesReportTests(LittleLemonTestCase):
+    reports = ['daily', 'menu-items', 'categories', 'delivery-crew']
+
+    def snapshot(self):
+        return {report: self.client.get(f'/api/reports/{report}').json() for report in self.reports}
+
+    def test_rollups_match_a_rebuild(self):
+        manager = self.create_user('manager', self.managers)
+        driver = self.create_user('driver', self.crew)
+        drinks = Category.objects.create(slug='drinks', title='Drinks')
+        menu = self.create_menu_items(4) + [MenuItem.objects.create(title='Lemonade', price=Decimal('3.00'), featured=True, category=drinks)]
+        customers = [self.create_user(f'customer{i}') for i in range(3)]
+
+        for index, customer in enumerate(customers):
+            self.client.force_authenticate(customer)
+            lines = [{'menuitem': item.id, 'quantity': index + 1} for item in menu[index:]]
+            self.client.post('/api/cart/menu-items', lines, format='json')
+            self.assertEqual(self.client.post('/api/orders').status_code, 201)
+
+        orders = list(Order.objects.order_by('id'))
+        self.client.force_authenticate(manager)
+        for order in orders[:2]:
+            response = self.client.patch(f'/api/orders/{order.id}', {'user': order.user_id, 'delivery_crew': driver.id}, format='json')
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.client.delete(f'/api/orders/{orders[1].id}').status_code, 200)
+
+        incremental = self.snapshot()
+        self.assertEqual(incremental['daily'][0]['orders'], 2)
+        self.assertEqual(incremental['delivery-crew'], [{'delivery_crew_id': driver.id, 'delivery_crew__username': 'driver', 'orders': 1}])
+        self.assertEqual(len(incremental['categories']), 2)
+
+        call_command('rebuild_sales_rollups', stdout=open(os.devnull, 'w'))
+        rebuilt = self.snapshot()
+        # Removing a day's only order leaves zeroed rows behind, which a rebuild doesn't create
+        for report in ('menu-items', 'categories'):
+            incremental[report] = [row for row in incremental[report] if row['quantity']]
+        self.assertEqual(incremental, rebuilt)
+
+    def test_reports_are_manager_only(self):
+        self.client.force_authenticate(self.create_user('customer'))
+        self.assertEqual(self.client.get('/api/reports/daily').status_code, 403)
+
+
+class BenchmarkBaselineTests(LittleLemonTestCase):
+    def compare(self, current, max_slowdown=None):
+        from .management.commands.benchmark import Command
+        baseline = {'endpoints': {'GET orders': {'p95': 10.0, 'queries': 3}}}
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as baseline_file:
+            json.dump(baseline, baseline_file)
+        self.addCleanup(os.unlink, baseline_file.name)
+        command = Command(stdout=open(os.devnull, 'w'))
+        command.compare({'endpoints': {'GET orders': current}}, baseline_file.name, max_slowdown)
+
+    def test_extra_queries_are_a_regression(self):
+        self.compare({'p95': 50.0, 'queries': 3})
+        with self.assertRaisesMessage(CommandError, '4 queries, baseline 3'):
+            self.compare({'p95': 5.0, 'queries': 4})
+
+    def test_slowdown_is_a_regression_when_enabled(self):
+        with self.assertRaisesMessage(CommandError, 'p95 16.00ms'):
+            self.compare({'p95': 16.0, 'queries': 3}, max_slowdown=1.5)
+
+
+class RequestMetricsTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+        self.manager = self.create_user('manager', self.managers)
+        self.client.force_authenticate(self.manager)
+
+    def test_metrics_endpoint_reports_histograms_per_view(self):
+        self.create_orders(self.create_user('customer'), 3, 2)
+        self.client.get('/api/orders')
+        self.client.get('/api/orders')
+
+        response = self.client.get('/api/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('# TYPE littlelemon_request_duration_seconds histogram', body)
+        self.assertIn('littlelemon_request_duration_seconds_count{view="OrdersView"} 2', body)
+        self.assertIn('littlelemon_request_queries_bucket{view="OrdersView",le="+Inf"} 2', body)
+        serializer_sum = next(line for line in body.splitlines() if line.startswith('littlelemon_request_serializer_seconds_sum{view="OrdersView"}'))
+        self.assertGreater(float(serializer_sum.split()[-1]), 0)
+
+    def test_streaming_responses_are_measured_as_they_are_sent(self):
+        self.create_orders(self.create_user('customer'), 3, 2)
+        response = self.client.get('/api/orders/export')
+        with CaptureQueriesContext(connection) as queries:
+            body = b''.join(response.streaming_content)
+        self.assertTrue(queries)
+
+        metrics = self.client.get('/api/metrics').content.decode()
+        self.assertIn(f'littlelemon_response_bytes_sum{{view="OrderExportView"}} {len(body)}', metrics)
+        recorded = next(line for line in metrics.splitlines() if line.startswith('littlelemon_request_queries_sum{view="OrderExportView"}'))
+        # The authentication and role lookups, then the body's queries
+        self.assertGreater(int(recorded.split()[-1]), len(queries))
+
+    def test_metrics_are_manager_only(self):
+        self.client.force_authenticate(self.create_user('customer'))
+        self.assertEqual(self.client.get('/api/metrics').status_code, 403)
+
+    @override_settings(SLOW_REQUEST_THRESHOLD_MS=0)
+    def test_slow_requests_are_logged_with_sql(self):
+        with self.assertLogs('LittleLemonAPI.slow_requests', 'WARNING') as logs:
+            self.client.get('/api/orders')
+        self.assertIn('OrdersView', logs.output[0])
+        self.assertIn('LittleLemonAPI_order', logs.output[0])
+
+
+class AsyncURLConf:
+    # The project urlconf as asgi.py serves it, with ASYNC_READS on
+    urlpatterns = [path('api/', include(api_patterns(async_reads=True)))]
+
+
+class AsyncReadTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+        self.customer = self.create_user('customer')
+        self.manager = self.create_user('manager', self.managers)
+        self.driver = self.create_user('driver', self.crew)
+        self.create_menu_items(5)
+        self.create_orders(self.customer, 3, 2)
+        Order.objects.filter(id=Order.objects.order_by('id').values('id')[:1]).update(delivery_crew=self.driver)
+
+    def sync_get(self, user, url):
+        self.client.force_authenticate(user)
+        return self.client.get(url)
+
+    def async_get(self, user, url):
+        token, _ = Token.objects.get_or_create(user=user)
+        with override_settings(ROOT_URLCONF=AsyncURLConf):
+            return async_to_sync(AsyncClient().get)(url, headers={'Authorization': f'Token {token.key}'})
+
+    def test_async_reads_match_sync_views(self):
+        order = Order.objects.filter(user=self.customer).first()
+        item = MenuItem.objects.first()
+        cases = [
+            (self.customer, '/api/menu-items?page_size=2&ordering=-price'),
+            (self.customer, f'/api/menu-items?category={self.category.id}&featured=true'),
+            (self.customer, f'/api/menu-items/{item.id}'),
+            (self.customer, '/api/menu-items/999999'),
+            (self.customer, '/api/orders'),
+            (self.manager, '/api/orders?page_size=2'),
+            (self.driver, '/api/orders'),
+            (self.customer, f'/api/orders/{order.id}'),
+            (self.driver, f'/api/orders/{order.id}'),
+            (self.manager, f'/api/orders/{order.id}'),
+        ]
+        for user, url in cases:
+            with self.subTest(user=user.username, url=url):
+                cache.clear()
+                expected = self.sync_get(user, url)
+                cache.clear()
+                actual = self.async_get(user, url)
+                self.assertEqual(actual.status_code, expected.status_code)
+                self.assertEqual(json.loads(actual.content), json.loads(expected.content))
+
+    def test_writes_on_async_routes_go_to_sync_views(self):
+        token, _ = Token.objects.get_or_create(user=self.manager)
+        client = AsyncClient()
+        with override_settings(ROOT_URLCONF=AsyncURLConf):
+            response = async_to_sync(client.post)(
+                '/api/menu-items', {'title': 'Async special', 'price': '4.50', 'featured': False, 'category': self.category.id},
+                content_type='application/json', headers={'Authorization': f'Token {token.key}'},
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(MenuItem.objects.filter(title='Async special').exists())
+
+    def test_async_requests_are_measured(self):
+        self.async_get(self.customer, '/api/orders')
+        body = registry.render()
+        self.assertIn('littlelemon_request_duration_seconds_count{view="OrdersView"} 1', body)
+        queries = next(line for line in body.splitlines() if line.startswith('littlelemon_request_queries_sum{view="OrdersView"}'))
+        self.assertGreater(float(queries.split()[-1]), 0)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite connection tuning')
+class SQLiteTuningTests(LittleLemonTestCase):
+    def pragmas(self, options):
+        with tempfile.TemporaryDirectory() as directory:
+            settings_dict = {**connection.settings_dict, 'NAME': os.path.join(directory, 'tuned.sqlite3'), 'OPTIONS': options}
+            wrapper = type(connections['default'])(settings_dict, alias='tuned')
+            try:
+                with wrapper.cursor() as cursor:
+                    pragmas = {}
+                    for pragma in ('journal_mode', 'synchronous', 'busy_timeout'):
+                        cursor.execute(f'PRAGMA {pragma}')
+                        pragmas[pragma] = cursor.fetchone()[0]
+            finally:
+                wrapper.close()
+        return pragmas, wrapper
+
+    def test_pragmas_are_applied_on_connect(self):
+        pragmas, wrapper = self.pragmas(connection.settings_dict['OPTIONS'])
+        self.assertEqual(pragmas, {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 5000})
+        if django.VERSION >= (5, 1):
+            self.assertEqual(wrapper.transaction_mode, 'IMMEDIATE')
+
+    def test_pragmas_are_applied_without_init_command(self):
+        # As configured for Django 5.0, which has no init_command option
+        pragmas, _ = self.pragmas({})
+        self.assertEqual(pragmas, {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 5000})
+
+
+REPLICA_WORKER = """
+import json
+import shutil
+import django
+from django.conf import settings
+django.setup()
+from django.core.management import call_command
+from django.db import connections
+from django.test.utils import setup_test_environment
+setup_test_environment()
+call_command('migrate', verbosity=0)
+if settings.THROTTLE_DATABASE:
+    call_command('migrate', database=settings.THROTTLE_DATABASE, verbosity=0)
+connections.close_all()
+# Stand-in for replication: the replica starts as a copy of the primary and then lags behind it
+shutil.copyfile(settings.DATABASES['default']['NAME'], settings.DATABASES['replica1']['NAME'])
+
+from django.contrib.auth.models import User, Group
+from rest_framework.test import APIClient
+from LittleLemonAPI.models import Category
+manager = User.objects.create(username='manager')
+Group.objects.create(name='manager').user_set.add(manager)
+customer = User.objects.create(username='customer')
+category = Category.objects.create(slug='mains', title='Mains')
+
+def count(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return len(client.get('/api/menu-items?page_size=5').json()['results'])
+
+client = APIClient()
+client.force_authenticate(manager)
+created = client.post('/api/menu-items', {'title': 'Soup', 'price': '4.00', 'featured': False, 'category': category.id}, format='json').status_code
+# The customer is not pinned and reads first, filling the cache both of them read from
+print(json.dumps([created, count(customer), count(manager)]))
+"""
+
+
+class ReplicaRoutingTests(LittleLemonTestCase):
+    def route(self, method, user=None):
+        request = RequestFactory().generic(method, '/api/menu-items')
+        request.user = user or AnonymousUser()
+        databases = {}
+
+        def get_response(request):
+            databases['read'] = router.db_for_read(MenuItem)
+            databases['user'] = router.db_for_read(User)
+            databases['write'] = router.db_for_write(MenuItem)
+            return HttpResponse(status=201 if method == 'POST' else 200)
+
+        ReplicaRoutingMiddleware(get_response)(request)
+        return databases
+
+    @override_settings(DATABASE_REPLICAS=['replica1'])
+    def test_safe_reads_go_to_replicas_until_the_user_writes(self):
+        customer = self.create_user('customer')
+        self.assertEqual(self.route('GET', customer), {'read': 'replica1', 'user': 'default', 'write': 'default'})
+        self.assertEqual(self.route('HEAD')['read'], 'replica1')
+        self.assertEqual(self.route('POST', customer)['read'], 'default')
+        self.assertEqual(self.route('GET', customer)['read'], 'default')
+        self.assertEqual(self.route('GET', self.create_user('other'))['read'], 'replica1')
+
+        cache.delete(pin_key(customer.pk))
+        self.assertEqual(self.route('GET', customer)['read'], 'replica1')
+
+    def test_everything_uses_the_primary_without_replicas(self):
+        self.assertEqual(self.route('GET')['read'], 'default')
+
+    @skipUnless(connection.vendor == 'sqlite', 'Two SQLite files stand in for a primary and a replica')
+    def test_reads_your_own_writes_with_a_lagging_replica(self):
+        with tempfile.TemporaryDirectory() as directory:
+            worker = subprocess.run(
+                [sys.executable, '-c', REPLICA_WORKER],
+                cwd=Path(__file__).resolve().parent.parent,
+                env={
+                    **os.environ,
+                    'DJANGO_SETTINGS_MODULE': 'LittleLemon.settings',
+                    'LITTLELEMON_DB_ENGINE': 'sqlite',
+                    'LITTLELEMON_DB_NAME': os.path.join(directory, 'primary.sqlite3'),
+                    'LITTLELEMON_DB_REPLICAS': os.path.join(directory, 'replica.sqlite3'),
+                },
+                stdout=subprocess.PIPE,
+                text=True,
+            )
+        self.assertEqual(worker.returncode, 0)
+        # The cached menu comes from the primary, so neither read sees the stale replica
+        self.assertEqual(json.loads(worker.stdout), [201, 1, 1])
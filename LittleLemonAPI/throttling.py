@@ -0,0 +1,83 @@
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import OperationalError, connections, router
+from rest_framework import throttling
+
+from .models import ThrottleCounter
+
+
+# Fixed-window throttles whose counters live in shared storage, so the limits
+# hold across worker processes. Each request costs one atomic increment instead
+# of DRF's read-modify-write of a timestamp list in the per-process cache.
+#
+# Counters are kept in the ThrottleCounter table by default, which the router puts
+# in THROTTLE_DATABASE when one is set. Setting THROTTLE_CACHE to a cache alias
+# whose incr() is atomic (Redis, Memcached) moves them there instead. A counter
+# that can't be written (a locked or unavailable database) lets the request through.
+
+logger = logging.getLogger('LittleLemonAPI.throttling')
+
+
+def hit(key, window, duration):
+    alias = getattr(settings, 'THROTTLE_CACHE', None)
+    if alias:
+        return _hit_cache(caches[alias], key, window, duration)
+    try:
+        return _hit_database(key, window)
+    except OperationalError as error:
+        logger.warning('Throttle counter %s not updated: %s', key, error)
+        return 0
+
+
+def _hit_cache(cache, key, window, duration):
+    key = f'{key}:{window}'
+    if cache.add(key, 1, timeout=duration):
+        return 1
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Expired between add() and incr()
+        cache.add(key, 1, timeout=duration)
+        return 1
+
+
+def _hit_database(key, window):
+    connection = connections[router.db_for_write(ThrottleCounter)]
+    table = connection.ops.quote_name(ThrottleCounter._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ("key", "window", "hits") VALUES (%s, %s, 1) '
+            f'ON CONFLICT ("key") DO UPDATE SET '
+            f'"hits" = CASE WHEN {table}."window" = excluded."window" THEN {table}."hits" + 1 ELSE 1 END, '
+            f'"window" = excluded."window" '
+            f'RETURNING "hits"',
+            [key, window],
+        )
+        return cursor.fetchone()[0]
+
+
+class FixedWindowRateThrottle(throttling.SimpleRateThrottle):
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        self.window = int(self.now // self.duration)
+        return hit(self.key, self.window, self.duration) <= self.num_requests
+
+    def wait(self):
+        return (self.window + 1) * self.duration - self.now
+
+
+class SharedAnonRateThrottle(FixedWindowRateThrottle, throttling.AnonRateThrottle):
+    pass
+
+
+class SharedUserRateThrottle(FixedWindowRateThrottle, throttling.UserRateThrottle):
+    pass
@@ -1,19 +1,39 @@
+from django.conf import settings
 from django.urls import path, include
 from .views import *
+from . import async_views
 
-urlpatterns = [
-    path('users/', include('djoser.urls')),
 
-    path('menu-items', MenuItemsView.as_view()),
-    path('menu-items/<int:menuItem>', MenuItemView.as_view()),
+def api_patterns(async_reads=False):
+    # With async_reads the hot GET endpoints are served by the async views in async_views.py
+    def view(sync_view, async_view=None):
+        if async_reads and async_view:
+            return async_views.read_write_view(sync_view, async_view)
+        return sync_view.as_view()
 
-    path('groups/manager/users', ManagersView.as_view()),
-    path('groups/manager/users/<int:userId>', ManagerDeleteView.as_view()),
-    path('groups/delivery-crew/users', DeliveryCrewUsersView.as_view()),
-    path('groups/delivery-crew/users/<int:userId>', RemoveDeliveryCrewUserView.as_view()),
+    return [
+        path('users/', include('djoser.urls')),
 
-    path('cart/menu-items', CustomerCartView.as_view()),
+        path('menu-items', view(MenuItemsView, async_views.AsyncMenuItemsView)),
+        path('menu-items/<int:menuItem>', view(MenuItemView, async_views.AsyncMenuItemView)),
+        path('menu-items/import', view(MenuImportView)),
 
-    path('orders', OrdersView.as_view()),
-    path('orders/<int:orderId>', OrderView.as_view()),
-]
+        path('groups/manager/users', view(ManagersView)),
+        path('groups/manager/users/<int:userId>', view(ManagerDeleteView)),
+        path('groups/delivery-crew/users', view(DeliveryCrewUsersView)),
+        path('groups/delivery-crew/users/<int:userId>', view(RemoveDeliveryCrewUserView)),
+
+        path('cart/menu-items', view(CustomerCartView)),
+
+        path('orders', view(OrdersView, async_views.AsyncOrdersView)),
+        path('orders/<int:orderId>', view(OrderView, async_views.AsyncOrderView)),
+        path('orders/export', view(OrderExportView)),
+        path('orders/bulk', view(OrderBulkView)),
+
+        path('reports/<str:report>', view(SalesReportView)),
+
+        path('metrics', view(MetricsView)),
+    ]
+
+
+urlpatterns = api_patterns(settings.ASYNC_READS)
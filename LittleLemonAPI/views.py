@@ -1,117 +1,244 @@
+import codecs
+import csv
+from datetime import date
+from itertools import chain
+from decimal import Decimal
+from django.conf import settings
+
 from rest_framework import generics
 from django.shortcuts import get_object_or_404
-from django.http.response import JsonResponse, HttpResponseBadRequest
-from .serializers import MenuItemSerializer, UserSerializer, UserCartSerializer, OrderItemSerializer, UserOrdersSerializer
-from .models import MenuItem, OrderItem, Cart, Order
+from django.db import transaction, IntegrityError
+from django.db.models import F, Prefetch, Q, Sum
+from django.http.response import HttpResponse, JsonResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.core.exceptions import ValidationError
+from django.utils.http import parse_etags
+from .serializers import MenuItemSerializer, UserSerializer, UserCartSerializer, CartBatchLineSerializer, GroupMembersSerializer, OrderBulkOperationSerializer, OrderItemSerializer, UserOrdersSerializer, CompactMenuItemSerializer, CompactOrderSerializer
+from .models import MenuItem, OrderItem, Cart, Order, ArchivedOrder, ArchivedOrderItem, DailySales, DailyMenuItemSales, DailyCategorySales, DailyCrewOrders
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
-from django.contrib.auth.models import User, Group
+from django.contrib.auth.models import User
 from rest_framework.response import Response
 from .permissions import *
-from rest_framework.throttling import UserRateThrottle, AnonRateThrottle
+from .roles import get_roles, load_roles, clear_roles, group_id, is_manager, is_delivery_crew, MANAGER, DELIVERY_CREW
+from .cache import MenuCacheMixin
+from .filters import PrefixSearchFilter, MenuItemFilter, OrderFilter, DateRangeFilter
+from .export import ndjson_rows, csv_rows
+from .bulk import case_update
+from . import catalogue, dispatch, reporting
+from .metrics import registry
+from .pagination import LittleLemonCursorPagination, OrderCursorPagination, MenuItemCursorPagination
+from .throttling import SharedAnonRateThrottle, SharedUserRateThrottle
+from rest_framework.filters import OrderingFilter
+from rest_framework.parsers import MultiPartParser
 
 # Create your views here.
 
 # Mixins to avoid duplicate code
 
+class OrderGraphMixin():
+    # Loads orders, their items and the items' menu entries in a fixed number of queries.
+    def get_order_queryset(self):
+        items = OrderItem.objects.select_related('menuitem')
+        return Order.objects.prefetch_related(Prefetch('orderitem_set', queryset=items))
+
+    def get_archived_order_queryset(self):
+        # The same for orders moved to the archive (see archive.py)
+        items = ArchivedOrderItem.objects.select_related('menuitem')
+        return ArchivedOrder.objects.prefetch_related(Prefetch('orderitem_set', queryset=items))
+
+class CompactListMixin():
+    # GET listings select .values() rows and serialize them with compact_serializer_class
+    # (see serializers.py) unless COMPACT_SERIALIZERS is off.
+    compact_serializer_class = None
+
+    def compact(self):
+        return self.request.method == 'GET' and getattr(settings, 'COMPACT_SERIALIZERS', True)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        return self.compact_serializer_class.values(queryset) if self.compact() else queryset
+
+    def get_serializer_class(self):
+        return self.compact_serializer_class if self.compact() else super().get_serializer_class()
+
 class AdminsForPostMixin():
     def get_permissions(self):
-        print(self.request.method)
         if self.request.method == 'POST':
             return [IsAuthenticated(), IsManager()]
         
         return [AllowAny()]
 
 class ThrottleForAnonsAndUsersMixin():
-    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+    throttle_classes = [SharedAnonRateThrottle, SharedUserRateThrottle]
 
 
 # Views
 
-class MenuItemsView(AdminsForPostMixin, ThrottleForAnonsAndUsersMixin, generics.ListAPIView, generics.ListCreateAPIView):
+class MenuItemsView(MenuCacheMixin, AdminsForPostMixin, CompactListMixin, ThrottleForAnonsAndUsersMixin, generics.ListAPIView, generics.ListCreateAPIView):
     queryset = MenuItem.objects.all()
     serializer_class = MenuItemSerializer
+    compact_serializer_class = CompactMenuItemSerializer
+    pagination_class = MenuItemCursorPagination
+    filter_backends = [PrefixSearchFilter, MenuItemFilter, OrderingFilter]
     ordering_fields = ['price']
     search_fields = ['title']
 
 
-class MenuItemView(ThrottleForAnonsAndUsersMixin, generics.RetrieveAPIView, generics.RetrieveUpdateDestroyAPIView):
+class MenuItemView(MenuCacheMixin, ThrottleForAnonsAndUsersMixin, generics.RetrieveAPIView, generics.RetrieveUpdateDestroyAPIView):
     queryset = MenuItem.objects.all()
     serializer_class = MenuItemSerializer
     lookup_field = 'id'
     lookup_url_kwarg = "menuItem"
 
     def get_permissions(self):
-        print(self.request.method)
         if self.request.method in ['POST', 'PUT', 'DELETE']:
             return [IsAuthenticated(), IsManager()]
         
         return [AllowAny()]
 
 
-class ManagersView(generics.ListCreateAPIView, ThrottleForAnonsAndUsersMixin):
-    queryset = User.objects.filter(groups__name='manager')
-    serializer_class = UserSerializer
+class MenuImportView(generics.GenericAPIView, ThrottleForAnonsAndUsersMixin):
+    # A CSV upload in the "file" field, imported as by `manage.py import_menu` (see
+    # catalogue.py). Django spools large uploads to disk, and the file is read a
+    # line at a time from there.
     permission_classes = [IsAuthenticated, IsManager]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get('file')
+        if(upload is None):
+            return JsonResponse(status=400, data={'message': 'Upload a CSV file in the "file" field.'})
+        try:
+            result = catalogue.import_menu(codecs.iterdecode(upload, 'utf-8-sig'))
+        except (UnicodeDecodeError, ValueError, csv.Error) as error:
+            return JsonResponse(status=400, data={'message': f'Import failed: {error}'})
+        return Response(result.as_dict())
+
+
+class GroupMembersMixin:
+    # Many users at once: {"usernames": [...], "ids": [...]} resolves every user with
+    # one query and changes the memberships with one bulk INSERT or DELETE on the
+    # user-groups table, reporting the outcome for each user. The group's id is cached.
+    group_name = None
+    max_batch_users = 500
 
     def post(self, request, *args, **kwargs):
-        username = request.data['username']
-        if username:
+        if(isinstance(request.data, dict) and 'username' in request.data):
+            username = request.data['username']
+            if(not username):
+                return JsonResponse(status=400, data={'message': 'Give a username.'})
             user = get_object_or_404(User, username=username)
-            manager_group = Group.objects.get(name='manager')
-            manager_group.user_set.add(user)
-            return JsonResponse(status=201, data={'message':'User added to Manager Group.'})
+            user.groups.add(group_id(self.group_name))
+            clear_roles(request)
+            return JsonResponse(status=201, data={'message': self.added_message})
+        return self.change_members(request, add=True)
 
+    def delete(self, request, *args, **kwargs):
+        return self.change_members(request, add=False)
+
+    def change_members(self, request, add):
+        serialized = GroupMembersSerializer(data=request.data)
+        serialized.is_valid(raise_exception=True)
+        usernames = serialized.validated_data.get('usernames', [])
+        ids = serialized.validated_data.get('ids', [])
+        requested = [('username', username) for username in usernames] + [('id', pk) for pk in ids]
+        if(len(requested) > self.max_batch_users):
+            return JsonResponse(status=400, data={'message': f'At most {self.max_batch_users} users per request.'})
+
+        users = {}
+        for pk, username in User.objects.filter(Q(username__in=usernames) | Q(pk__in=ids)).values_list('pk', 'username'):
+            users[('id', pk)] = users[('username', username)] = (pk, username)
+        found = {users[key][0] for key in requested if key in users}
+
+        group = group_id(self.group_name)
+        Membership = User.groups.through
+        with transaction.atomic():
+            members = set(Membership.objects.filter(group_id=group, user_id__in=found).values_list('user_id', flat=True))
+            if(add):
+                changed = found - members
+                Membership.objects.bulk_create([Membership(user_id=pk, group_id=group) for pk in changed], ignore_conflicts=True)
+            else:
+                changed = members
+                if(changed):
+                    Membership.objects.filter(group_id=group, user_id__in=changed).delete()
+        clear_roles(request)
+
+        results = []
+        for field, value in requested:
+            if((field, value) not in users):
+                results.append({field: value, 'result': 'not_found'})
+                continue
+            pk, username = users[(field, value)]
+            if(pk in changed):
+                result = 'added' if add else 'removed'
+            else:
+                result = 'already_member' if add else 'not_member'
+            results.append({'id': pk, 'username': username, 'result': result})
+        return Response({'results': results})
 
-class ManagerDeleteView(generics.DestroyAPIView, ThrottleForAnonsAndUsersMixin):
-    serializer_class = UserSerializer
-    permission_classes = [IsAuthenticated, IsManager]
-    queryset = User.objects.filter(groups__name='manager')
+
+class GroupMemberDeleteMixin:
+    group_name = None
 
     def delete(self, request, *args, **kwargs):
         pk = self.kwargs['userId']
         user = get_object_or_404(User, pk=pk)
-        managers = Group.objects.get(name='manager')
-        managers.user_set.remove(user)
-        return JsonResponse(status=200, data={'message':'User removed from manager Group.'})
+        user.groups.remove(group_id(self.group_name))
+        clear_roles(request)
+        return JsonResponse(status=self.removed_status, data={'message': self.removed_message})
 
 
-class DeliveryCrewUsersView(generics.ListCreateAPIView, ThrottleForAnonsAndUsersMixin):
-    queryset = User.objects.filter(groups__name='delivery-crew')
+class ManagersView(GroupMembersMixin, generics.ListCreateAPIView, ThrottleForAnonsAndUsersMixin):
+    pagination_class = LittleLemonCursorPagination
+    queryset = User.objects.filter(groups__name='manager')
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated, IsManager]
-
-    def post(self, request, *args, **kwargs):
-        username = request.data['username']
-        if username:
-            user = get_object_or_404(User, username=username)
-            crew = Group.objects.get(name='delivery-crew')
-            crew.user_set.add(user)
-            return JsonResponse(status=201, data={'message':'User added to delivery-crew Group.'})
+    group_name = MANAGER
+    added_message = 'User added to Manager Group.'
 
 
-class RemoveDeliveryCrewUserView(generics.RetrieveDestroyAPIView, ThrottleForAnonsAndUsersMixin):
+class ManagerDeleteView(GroupMemberDeleteMixin, generics.DestroyAPIView, ThrottleForAnonsAndUsersMixin):
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated, IsManager]
+    queryset = User.objects.filter(groups__name='manager')
+    group_name = MANAGER
+    removed_status = 200
+    removed_message = 'User removed from manager Group.'
+
+
+class DeliveryCrewUsersView(GroupMembersMixin, generics.ListCreateAPIView, ThrottleForAnonsAndUsersMixin):
+    pagination_class = LittleLemonCursorPagination
     queryset = User.objects.filter(groups__name='delivery-crew')
+    serializer_class = UserSerializer
+    permission_classes = [IsAuthenticated, IsManager]
+    group_name = DELIVERY_CREW
+    added_message = 'User added to delivery-crew Group.'
 
-    def delete(self, request, *args, **kwargs):
-        pk = self.kwargs['userId']
-        user = get_object_or_404(User, pk=pk)
-        managers = Group.objects.get(name='delivery-crew')
-        managers.user_set.remove(user)
-        return JsonResponse(status=201, data={'message':'User removed from the delivery-crew Group.'})
+
+class RemoveDeliveryCrewUserView(GroupMemberDeleteMixin, generics.RetrieveDestroyAPIView, ThrottleForAnonsAndUsersMixin):
+    serializer_class = UserSerializer
+    permission_classes = [IsAuthenticated, IsManager]
+    queryset = User.objects.filter(groups__name='delivery-crew')
+    group_name = DELIVERY_CREW
+    # 201 as before, for existing clients
+    removed_status = 201
+    removed_message = 'User removed from the delivery-crew Group.'
 
 
 class CustomerCartView(generics.ListCreateAPIView, ThrottleForAnonsAndUsersMixin):
-    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+    throttle_classes = [SharedAnonRateThrottle, SharedUserRateThrottle]
     serializer_class = UserCartSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = LittleLemonCursorPagination
+    max_batch_lines = 100
 
     def get_queryset(self, *args, **kwargs):
-        cart = Cart.objects.filter(user=self.request.user)
+        cart = Cart.objects.filter(user=self.request.user).select_related('menuitem')
         return cart
 
     def post(self, request, *arg, **kwargs):
+        if isinstance(request.data, list):
+            return self.post_batch(request)
+
         serialized_item = UserCartSerializer(data=request.data)
         serialized_item.is_valid(raise_exception=True)
         id = request.data['menuitem']
@@ -119,28 +246,68 @@ class CustomerCartView(generics.ListCreateAPIView, ThrottleForAnonsAndUsersMixin
         item = get_object_or_404(MenuItem, id=id)
         price = int(quantity) * item.price
         try:
-            Cart.objects.create(user=request.user, quantity=quantity, unit_price=item.price, price=price, menuitem_id=id)
-        except Exception as e:
-            print(str(e))
+            with transaction.atomic():
+                Cart.objects.create(user=request.user, quantity=quantity, unit_price=item.price, price=price, menuitem_id=id)
+        except IntegrityError:
             return JsonResponse(status=409, data={'message':'Item already in cart'})
         return JsonResponse(status=201, data={'message':'Item added to cart!'})
 
+    def post_batch(self, request):
+        # A list of {menuitem, quantity} lines sets the quantity of each item in the
+        # cart, adding the ones that aren't there yet. Invalid lines are reported
+        # and skipped; the valid ones are written with a single upsert.
+        if len(request.data) > self.max_batch_lines:
+            return JsonResponse(status=400, data={'message': f'At most {self.max_batch_lines} lines per request.'})
+
+        lines, results = {}, []
+        for line in request.data:
+            serialized_line = CartBatchLineSerializer(data=line)
+            if serialized_line.is_valid():
+                lines[serialized_line.validated_data['menuitem']] = serialized_line.validated_data['quantity']
+                results.append({'menuitem': serialized_line.validated_data['menuitem'], 'status': None})
+            else:
+                results.append({'menuitem': line.get('menuitem') if isinstance(line, dict) else None, 'status': 'invalid', 'errors': serialized_line.errors})
+
+        menu_items = MenuItem.objects.in_bulk(list(lines))
+        in_cart = set(Cart.objects.filter(user=request.user, menuitem_id__in=list(menu_items)).values_list('menuitem_id', flat=True))
+        Cart.objects.bulk_create(
+            [
+                Cart(user=request.user, menuitem=item, quantity=lines[id], unit_price=item.price, price=lines[id] * item.price)
+                for id, item in menu_items.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['menuitem', 'user'],
+            update_fields=['quantity', 'unit_price', 'price'],
+        )
+
+        for result in results:
+            if result['status'] is None:
+                if result['menuitem'] not in menu_items:
+                    result.update(status='invalid', errors={'menuitem': ['Menu item not found.']})
+                else:
+                    result['status'] = 'updated' if result['menuitem'] in in_cart else 'added'
+        return JsonResponse(status=200, data={'results': results})
+
 
     def delete(self, request, *arg, **kwargs):
         Cart.objects.filter(user=request.user).delete()
         return JsonResponse(status=201, data={'message':'All items were removed from the cart.'})
 
 
-class OrdersView(generics.ListCreateAPIView, ThrottleForAnonsAndUsersMixin):
+class OrdersView(OrderGraphMixin, CompactListMixin, generics.ListCreateAPIView, ThrottleForAnonsAndUsersMixin):
     serializer_class = UserOrdersSerializer
+    compact_serializer_class = CompactOrderSerializer
+    pagination_class = OrderCursorPagination
+    filter_backends = [OrderFilter]
         
     def get_queryset(self, *args, **kwargs):
-        if self.request.user.groups.filter(name='manager').exists() or self.request.user.is_superuser:
-            query = Order.objects.all()
-        elif self.request.user.groups.filter(name='delivery-crew').exists():
-            query = Order.objects.filter(delivery_crew=self.request.user)
+        orders = self.get_order_queryset()
+        if is_manager(self.request) or self.request.user.is_superuser:
+            query = orders.all()
+        elif is_delivery_crew(self.request):
+            query = orders.filter(delivery_crew=self.request.user)
         else:
-            query = Order.objects.filter(user=self.request.user)
+            query = orders.filter(user=self.request.user)
         return query
 
     def get_permissions(self):
@@ -152,24 +319,39 @@ class OrdersView(generics.ListCreateAPIView, ThrottleForAnonsAndUsersMixin):
         return[permission() for permission in permission_classes]
 
     def post(self, request, *args, **kwargs):
-        cart = Cart.objects.filter(user=request.user)
+        with transaction.atomic():
+            cart = list(Cart.objects.select_for_update().filter(user=request.user))
+
+            if not cart:
+                return HttpResponseBadRequest()
+
+            # Deleting the cart first claims it: a concurrent checkout of the same
+            # cart deletes fewer rows than it read and is rolled back.
+            claimed, _ = Cart.objects.filter(pk__in=[item.pk for item in cart]).delete()
+            if claimed != len(cart):
+                transaction.set_rollback(True)
+                return JsonResponse(status=409, data={'message':'Your cart changed during checkout, please try again.'})
+
+            total = sum(item.total() for item in cart)
+            order = Order.objects.create(user=request.user, status=False, total=total)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, unit_price=item.unit_price, price=item.price, menuitem_id=item.menuitem_id, quantity=item.quantity)
+                for item in cart
+            ])
+
+            categories = dict(MenuItem.objects.filter(id__in=[item.menuitem_id for item in cart]).values_list('id', 'category_id'))
+            reporting.apply_orders([order], {order.id: [
+                {'menuitem_id': item.menuitem_id, 'category_id': categories[item.menuitem_id], 'quantity': item.quantity, 'price': item.price}
+                for item in cart
+            ]})
+
+            if getattr(settings, 'DISPATCH_ON_CHECKOUT', False):
+                dispatch.dispatch(order_ids=[order.id])
 
-        if cart.count() == 0:
-            return HttpResponseBadRequest()
-        
-        total = sum([item.total() for item in cart])
-        order = Order.objects.create(user=request.user, status=False, total=total)
-        
-        for i in cart.values():
-            menuitem = get_object_or_404(MenuItem, id=i['menuitem_id'])
-            orderitem = OrderItem.objects.create(order=order, unit_price=i['unit_price'], price=i['price'], menuitem=menuitem, quantity=i['quantity'])
-            orderitem.save()
-        
-        cart.delete()
         return JsonResponse(status=201, data={'message':'Your order has been placed! Your order number: {}'.format(str(order.id))})
 
 
-class OrderView(generics.ListCreateAPIView, ThrottleForAnonsAndUsersMixin):
+class OrderView(OrderGraphMixin, generics.ListCreateAPIView, ThrottleForAnonsAndUsersMixin):
     serializer_class = UserOrdersSerializer
     
     def get_permissions(self):
@@ -180,69 +362,279 @@ class OrderView(generics.ListCreateAPIView, ThrottleForAnonsAndUsersMixin):
         return[permission() for permission in permission_classes] 
 
     def get_queryset(self, *args, **kwargs):
-        query = Order.objects.filter(pk=self.kwargs['orderId'])
+        query = self.get_order_queryset().filter(pk=self.kwargs['orderId'])
         return query
     
+    def get_archived_queryset(self):
+        return self.get_archived_order_queryset().filter(pk=self.kwargs['orderId'])
+
     def get(self, request, *args, **kwargs):
-        if(request.user.groups.filter(name="manager").exists()):
-            return super().get(request, *args, **kwargs)
-        elif(request.user.groups.filter(name="delivery-crew").exists()):
-            if(self.get_queryset()[0].delivery_crew == request.user):
-                return super().get(request, *args, **kwargs)
-            elif(self.get_queryset()[0].user == request.user):
-                return super().get(request, *args, **kwargs)
-        elif(self.get_queryset()[0].user == request.user):
-                return super().get(request, *args, **kwargs)
+        # Archived orders are read-only: updates and deletes only see live ones
+        orders = list(self.get_queryset()) or list(self.get_archived_queryset())
+        return self.detail_response(request, orders, get_roles(request))
+
+    def detail_response(self, request, orders, roles):
+        if(MANAGER in roles):
+            return self.tagged(Response(self.get_serializer(orders, many=True).data), orders)
+        if(not orders):
+            return JsonResponse(status = 404, data={"message": "Order not found."})
+
+        order = orders[0]
+        if(order.user_id == request.user.pk or (DELIVERY_CREW in roles and order.delivery_crew_id == request.user.pk)):
+            return self.tagged(Response(self.get_serializer(orders, many=True).data), orders)
         
         return JsonResponse(status = 403, data={"message": "You don't have the required permissions."})
-    
-    def update_data(self, request, order):
-        user = request.user
 
-        if(user.groups.filter(name='manager').exists()):
+    # Optimistic locking: GET sends the order's version as its ETag, and updates sent
+    # with If-Match only apply to that version, with 412 otherwise. Updates write
+    # only the fields they change, in one conditional UPDATE that bumps the version.
+
+    def etag(self, version):
+        return f'"{self.kwargs["orderId"]}.{version}"'
+
+    def tagged(self, response, orders):
+        if(len(orders) == 1):
+            response['ETag'] = self.etag(orders[0].version)
+        return response
+
+    def expected_version(self, request):
+        # None without If-Match (or with *); 0, which never matches, when it names no version of this order
+        header = request.headers.get('If-Match', '').strip()
+        if(not header or header == '*'):
+            return None
+        prefix = self.etag('')[:-1]
+        for tag in parse_etags(header):
+            # Weak tags too: GZipMiddleware weakens the ETags it sends
+            version = tag.removeprefix('W/')[len(prefix):-1]
+            if(tag.removeprefix('W/').startswith(prefix) and version.isdigit()):
+                return int(version)
+        return 0
+
+    def precondition_failed(self, version):
+        response = JsonResponse(status=412, data={'message': 'The order was changed since you last read it.'})
+        response['ETag'] = self.etag(version)
+        return response
+
+    def updated(self, status, message, version):
+        response = JsonResponse(status=status, data={'message': message})
+        if(version is not None):
+            response['ETag'] = self.etag(version)
+        return response
+
+    def locked_order(self):
+        return Order.objects.select_for_update().filter(pk=self.kwargs['orderId']).values('user_id', 'delivery_crew_id', 'date', 'total', 'version').first()
+
+    def update_data(self, request):
+        roles = get_roles(request)
+        order_pk = self.kwargs['orderId']
+        expected = self.expected_version(request)
+
+        if(MANAGER in roles):
             serialized_item = UserOrdersSerializer(data=request.data)
             serialized_item.is_valid(raise_exception=True)
-            order_pk = self.kwargs['orderId']
-            crew_pk = request.data['delivery_crew'] 
-            order = get_object_or_404(Order, pk=order_pk)
-            crew = get_object_or_404(User, pk=crew_pk)
-            if(crew.groups.filter(name="delivery-crew").exists()):
-                order.delivery_crew = crew
-                order.save()
-                return JsonResponse(status=201, data={'message': f'Updated. {crew.username} was assigned to order #{order.id}'})
-            else:
+            crew = get_object_or_404(User, pk=request.data['delivery_crew'])
+            if(DELIVERY_CREW not in load_roles(crew)):
                 return HttpResponseBadRequest()
-        elif(user.groups.filter(name='delivery-crew').exists()):
-            print("B")
-            order = Order.objects.get(pk=self.kwargs['orderId'])
-            if(order.delivery_crew and order.delivery_crew.pk == request.user.pk):
-                order.status = request.data.get('status')
-                order.save()
-                return JsonResponse(status=200, data={'message': f'Status of order #{order.id} changed to {order.status}.'})
-            else:
+            with transaction.atomic():
+                current = self.locked_order()
+                if(current is None):
+                    return JsonResponse(status = 404, data={"message": "Order not found."})
+                if(expected is not None and expected != current['version']):
+                    return self.precondition_failed(current['version'])
+                # The date, which the sales rollups are keyed on, stays unchanged
+                Order.objects.filter(pk=order_pk).update(delivery_crew=crew.pk, version=F('version') + 1)
+                reporting.assign_crew([(current['date'], current['delivery_crew_id'], crew.pk)])
+            return self.updated(201, f'Updated. {crew.username} was assigned to order #{order_pk}', current['version'] + 1)
+        elif(DELIVERY_CREW in roles):
+            try:
+                status = Order._meta.get_field('status').to_python(request.data.get('status'))
+            except ValidationError as error:
+                return JsonResponse(status=400, data={'status': error.messages})
+            conditions = {} if expected is None else {'version': expected}
+            if(Order.objects.filter(pk=order_pk, delivery_crew=request.user.pk, **conditions).update(status=status, version=F('version') + 1)):
+                return self.updated(200, f'Status of order #{order_pk} changed to {status}.', None if expected is None else expected + 1)
+
+            # Nothing matched: find out why
+            current = Order.objects.filter(pk=order_pk).values('delivery_crew_id', 'version').first()
+            if(current is None):
+                return JsonResponse(status = 404, data={"message": "Order not found."})
+            if(current['delivery_crew_id'] != request.user.pk):
                 return JsonResponse(status = 403, data={'message': "You are not the delivery crew assigned to this order."})
+            return self.precondition_failed(current['version'])
         else: # Customer
-            print("C")
-            if(request.data):
-                serialized_item = UserOrdersSerializer(data=request.data, instance=Order.objects.get(pk=self.kwargs['orderId']))
-                if(request.user.pk == serialized_item.instance.user.pk):
-                    serialized_item.is_valid(raise_exception=True)
-                    serialized_item.save()
-                    return JsonResponse(status=201, data={'message': f'Order Updated.'})
-                else:
-                    return JsonResponse(status = 403, data={'message': "You are not the owner of the order."})
-            else:
+            if(not request.data):
                 return HttpResponseBadRequest()
+            serialized_item = UserOrdersSerializer(data=request.data)
+            serialized_item.is_valid(raise_exception=True)
+            # Saving the order used to set its auto_now date to today; update() has to do it explicitly
+            changes = {**serialized_item.validated_data, 'date': date.today()}
+            with transaction.atomic():
+                current = self.locked_order()
+                if(current is None):
+                    return JsonResponse(status = 404, data={"message": "Order not found."})
+                if(current['user_id'] != request.user.pk):
+                    return JsonResponse(status = 403, data={'message': "You are not the owner of the order."})
+                if(expected is not None and expected != current['version']):
+                    return self.precondition_failed(current['version'])
+                Order.objects.filter(pk=order_pk).update(**changes, version=F('version') + 1)
+
+                crew = changes['delivery_crew'].pk if changes.get('delivery_crew') else None
+                if((changes['date'], crew) != (current['date'], current['delivery_crew_id'])):
+                    previous = Order(id=order_pk, date=current['date'], total=current['total'], delivery_crew_id=current['delivery_crew_id'])
+                    order = Order(id=order_pk, date=changes['date'], total=current['total'], delivery_crew_id=crew)
+                    lines = reporting.load_lines([order_pk])
+                    reporting.apply_orders([previous], lines, -1)
+                    reporting.apply_orders([order], lines)
+            return self.updated(201, f'Order Updated.', current['version'] + 1)
 
     def patch(self, request, *args, **kwargs):
-        return self.update_data(request, Order.objects.get(pk = kwargs.get('orderId')))
+        return self.update_data(request)
 
     def put(self, request, *args, **kwargs):
-        return self.update_data(request, Order.objects.get(pk = kwargs.get('orderId')))
+        return self.update_data(request)
 
     def delete(self, request, *args, **kwargs):
-        order = Order.objects.get(pk=self.kwargs['orderId'])
-        order_number = str(order.id)
-        order.delete()
+        expected = self.expected_version(request)
+        with transaction.atomic():
+            order = Order.objects.select_for_update().filter(pk=self.kwargs['orderId']).first()
+            if(order is None):
+                return JsonResponse(status = 404, data={"message": "Order not found."})
+            if(expected is not None and expected != order.version):
+                return self.precondition_failed(order.version)
+            order_number = str(order.id)
+            reporting.apply_orders([order], reporting.load_lines([order.id]), -1)
+            order.delete()
         return JsonResponse(status=200, data={'message':f'Order #{order_number} was deleted.'})
-    
\ No newline at end of file
+
+
+class OrderBulkView(generics.GenericAPIView, ThrottleForAnonsAndUsersMixin):
+    # Many crew assignments (managers) and status changes (the assigned delivery crew)
+    # in one transaction, answered with a result per operation. Each operation may
+    # carry the order version it expects, as If-Match does on /orders/<id>.
+    permission_classes = [IsAuthenticated]
+    max_operations = 500
+
+    def post(self, request, *args, **kwargs):
+        roles = get_roles(request)
+        if(MANAGER not in roles and DELIVERY_CREW not in roles):
+            return JsonResponse(status = 403, data={"message": "You don't have the required permissions."})
+        if(not isinstance(request.data, list) or not request.data):
+            return JsonResponse(status=400, data={'message': 'Send a list of operations.'})
+        if(len(request.data) > self.max_operations):
+            return JsonResponse(status=400, data={'message': f'At most {self.max_operations} operations per request.'})
+        serialized = OrderBulkOperationSerializer(data=request.data, many=True)
+        serialized.is_valid(raise_exception=True)
+        operations = serialized.validated_data
+
+        # One membership query for every distinct crew member named
+        named_crew = {operation['delivery_crew'] for operation in operations if 'delivery_crew' in operation}
+        crew = set(User.objects.filter(pk__in=named_crew, groups__name=DELIVERY_CREW).values_list('pk', flat=True)) if(named_crew and MANAGER in roles) else set()
+
+        results, assignments, statuses = [], {}, {}
+        with transaction.atomic():
+            orders = Order.objects.select_for_update().filter(pk__in={operation['order_id'] for operation in operations})
+            orders = {order['id']: order for order in orders.values('id', 'delivery_crew_id', 'date', 'version')}
+            for operation in operations:
+                order_id = operation['order_id']
+                error = self.check(request, roles, crew, operation, orders.get(order_id), assignments.keys() | statuses.keys())
+                if(error):
+                    results.append({'order_id': order_id, **error})
+                    continue
+                if('delivery_crew' in operation):
+                    assignments[order_id] = operation['delivery_crew']
+                else:
+                    statuses[order_id] = operation['status']
+                results.append({'order_id': order_id, 'result': 'updated', 'version': orders[order_id]['version'] + 1})
+
+            if(assignments):
+                case_update(Order, ['delivery_crew'], [(pk, [crew_id]) for pk, crew_id in assignments.items()], increment='version')
+                reporting.assign_crew([(orders[pk]['date'], orders[pk]['delivery_crew_id'], crew_id) for pk, crew_id in assignments.items()])
+            if(statuses):
+                case_update(Order, ['status'], [(pk, [status]) for pk, status in statuses.items()], increment='version')
+        return Response({'results': results})
+
+    def check(self, request, roles, crew, operation, order, updated):
+        # The reason an operation can't be applied, following OrderView's per-role rules
+        if(order is None):
+            return {'result': 'not_found', 'message': 'Order not found.'}
+        if(order['id'] in updated):
+            return {'result': 'invalid', 'message': 'Only one operation per order.'}
+        if('version' in operation and operation['version'] != order['version']):
+            return {'result': 'precondition_failed', 'message': 'The order was changed since you last read it.', 'version': order['version']}
+        if('delivery_crew' in operation):
+            if(MANAGER not in roles):
+                return {'result': 'forbidden', 'message': 'Only managers can assign orders.'}
+            if(operation['delivery_crew'] not in crew):
+                return {'result': 'invalid', 'message': f"User #{operation['delivery_crew']} is not a delivery crew member."}
+        elif(order['delivery_crew_id'] != request.user.pk):
+            return {'result': 'forbidden', 'message': 'You are not the delivery crew assigned to this order.'}
+        return None
+
+
+class OrderExportView(OrderGraphMixin, generics.GenericAPIView, ThrottleForAnonsAndUsersMixin):
+    permission_classes = [IsAuthenticated, IsManager]
+    filter_backends = [OrderFilter]
+    chunk_size = 1000
+    outputs = {
+        'ndjson': (ndjson_rows, 'application/x-ndjson'),
+        'csv': (csv_rows, 'text/csv'),
+    }
+
+    def get_queryset(self, *args, **kwargs):
+        return self.get_order_queryset().order_by('id')
+
+    def get(self, request, *args, **kwargs):
+        output = request.query_params.get('output', 'ndjson')
+        if output not in self.outputs:
+            return JsonResponse(status=400, data={'message': f'Unknown output, use one of: {", ".join(self.outputs)}.'})
+
+        # iterator() streams from a server-side cursor where the backend has one and
+        # runs the item prefetch once per chunk of orders. Archived orders go first,
+        # being the older ones.
+        archived = self.filter_queryset(self.get_archived_order_queryset().order_by('id'))
+        orders = chain(
+            archived.iterator(chunk_size=self.chunk_size),
+            self.filter_queryset(self.get_queryset()).iterator(chunk_size=self.chunk_size),
+        )
+        rows, content_type = self.outputs[output]
+        response = StreamingHttpResponse(rows(orders), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="orders.{output}"'
+        return response
+
+
+class SalesReportView(generics.GenericAPIView, ThrottleForAnonsAndUsersMixin):
+    # Served from the daily rollup tables, never from Order/OrderItem
+    permission_classes = [IsAuthenticated, IsManager]
+    filter_backends = [DateRangeFilter]
+    reports = {
+        'daily': (DailySales, ['date'], ['orders', 'revenue']),
+        'menu-items': (DailyMenuItemSales, ['menuitem_id', 'menuitem__title'], ['quantity', 'revenue']),
+        'categories': (DailyCategorySales, ['category_id', 'category__title'], ['quantity', 'revenue']),
+        'delivery-crew': (DailyCrewOrders, ['delivery_crew_id', 'delivery_crew__username'], ['orders']),
+    }
+
+    def get(self, request, *args, **kwargs):
+        if(self.kwargs['report'] not in self.reports):
+            return JsonResponse(status=404, data={'message': f'Unknown report, use one of: {", ".join(self.reports)}.'})
+
+        model, group_by, totals = self.reports[self.kwargs['report']]
+        rows = self.filter_queryset(model.objects.all()).values(*group_by).annotate(
+            **{f'total_{name}': Sum(name) for name in totals}
+        ).order_by(*group_by)
+        return Response([
+            {**{name: row[name] for name in group_by}, **{name: self.format(row[f'total_{name}']) for name in totals}}
+            for row in rows
+        ])
+
+    def format(self, value):
+        # Money as a 2-place string, like the DecimalFields of the other endpoints
+        return f'{value:.2f}' if isinstance(value, Decimal) else value
+
+
+class MetricsView(generics.GenericAPIView, ThrottleForAnonsAndUsersMixin):
+    # Prometheus text exposition of this worker's request histograms
+    permission_classes = [IsAuthenticated, IsManager]
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+